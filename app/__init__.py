@@ -1,11 +1,35 @@
+import atexit
+from app.startup import StartupTimer
+startup_timer = StartupTimer()
+
 from app.game_db import GameDatabase
 
 game_database = GameDatabase()
+startup_timer.mark('database')
 
 from app.room_management import room_manager, register_socketio
+from app.scheduler import scheduler
+startup_timer.mark('room management')
 
 from app.app import app, register_blueprints
 from app.socket import socketio
+startup_timer.mark('socket.io')
 
 register_socketio(socketio)
 register_blueprints()
+startup_timer.mark('blueprints')
+startup_timer.report("Worker started")
+
+# the worker accepts connections while the database is warmed up
+socketio.start_background_task(game_database.warm_up)
+game_database.audit_log.start()
+game_database.round_history.start()
+
+def shutdown() -> None:
+    """Stop the scheduler and write the audit records and round results that are still buffered."""
+
+    scheduler.stop()
+    game_database.audit_log.stop()
+    game_database.round_history.stop()
+
+atexit.register(shutdown)
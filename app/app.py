@@ -1,4 +1,5 @@
-from flask import Flask, request, render_template, url_for
+from flask import Flask, Response, request, render_template, url_for
+from app.metrics import registry
 
 app = Flask(__name__)
 
@@ -9,9 +10,15 @@ app.config['SECRET_KEY'] = bytes(os.environ['SECRET_KEY'], 'utf-8')
 def register_blueprints():
     from app.room import room
     from app.game import game
+    from app.history import history
     app.register_blueprint(room)
     app.register_blueprint(game)
+    app.register_blueprint(history)
 
 @app.route('/')
 def home():
-    return render_template('home.html')
\ No newline at end of file
+    return render_template('home.html')
+
+@app.route('/metrics')
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
\ No newline at end of file
@@ -0,0 +1,176 @@
+import os
+import json
+import gzip
+import time
+import shutil
+import datetime
+from typing import Callable, List, NamedTuple, Union
+from eventlet import tpool
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateSchema
+from app.audit_models import AuditBase, QueryAudit
+from app.metrics import audit_records
+from app.write_behind import WriteBehindQueue
+
+class AuditRecord(NamedTuple):
+    room_code: Union[str, None]
+    user_id: Union[str, None]
+    # normalised, so the same query typed differently is logged the same
+    query: str
+    # the seconds it took to answer the query
+    duration: float
+    # the rows in the first page of the result
+    row_count: Union[int, None] = None
+    # the error the user was shown
+    error: Union[str, None] = None
+    # set by the audit log when the record is buffered
+    logged_at: Union[float, None] = None
+
+def _to_datetime(clock_time : float) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(clock_time, datetime.timezone.utc)
+
+class FileAuditSink():
+    """Appends records as JSON lines to a file that is rotated once it reaches a size, gzipping the rotated files if asked.
+
+    Batches are written from a real thread so that file access does not block the green threads.
+    """
+
+    def __init__(self, path : str, max_bytes : int = 50 * 1024 * 1024, backups : int = 5, compress : bool = True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.compress = compress
+
+    def write_batch(self, records : List[AuditRecord]) -> None:
+        """Write records to the end of the file.
+
+        Args:
+            records (List[AuditRecord]): The records in the order they were made.
+        """
+
+        lines = ''.join(json.dumps(self._to_dict(record), separators=(',', ':')) + '\n' for record in records)
+        tpool.execute(self._write, lines)
+
+    @staticmethod
+    def _to_dict(record : AuditRecord) -> dict:
+        row = record._asdict()
+        row['logged_at'] = _to_datetime(record.logged_at).isoformat()
+        return row
+
+    def _write(self, lines : str) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+            size = f.tell()
+
+        if self.max_bytes and size >= self.max_bytes:
+            self._rotate()
+
+    def _rotated_path(self, number : int) -> str:
+        return f'{self.path}.{number}' + ('.gz' if self.compress else '')
+
+    def _rotate(self) -> None:
+        """Move the file to the first backup, shifting older backups along and deleting the oldest."""
+
+        if not self.backups:
+            os.remove(self.path)
+            return
+
+        for number in range(self.backups - 1, 0, -1):
+            if os.path.exists(self._rotated_path(number)):
+                os.replace(self._rotated_path(number), self._rotated_path(number + 1))
+
+        if not self.compress:
+            os.replace(self.path, self._rotated_path(1))
+            return
+
+        rotating = self.path + '.rotating'
+        os.replace(self.path, rotating)
+        with open(rotating, 'rb') as source, gzip.open(self._rotated_path(1), 'wb') as target:
+            shutil.copyfileobj(source, target)
+
+        os.remove(rotating)
+
+class PostgresAuditSink():
+    """Inserts records into the audit.query_log table, creating it the first time a batch is written."""
+
+    def __init__(self, engine : Engine):
+        self.engine = engine
+        self._created = False
+
+    def write_batch(self, records : List[AuditRecord]) -> None:
+        """Insert records with one statement.
+
+        Args:
+            records (List[AuditRecord]): The records in the order they were made.
+        """
+
+        if not self._created:
+            self._create_table()
+
+        rows = []
+        for record in records:
+            row = record._asdict()
+            row['logged_at'] = _to_datetime(record.logged_at)
+            rows.append(row)
+
+        with self.engine.begin() as conn:
+            conn.execute(QueryAudit.__table__.insert(), rows)
+
+    def _create_table(self) -> None:
+        if not self.engine.dialect.has_schema(self.engine, 'audit'):
+            self.engine.execute(CreateSchema('audit'))
+
+        AuditBase.metadata.create_all(self.engine)
+        self._created = True
+
+class AuditLog(WriteBehindQueue):
+    """Keeps a record of player queries without making them wait for it to be written."""
+
+    def __init__(self, sink : Union[FileAuditSink, PostgresAuditSink, None], max_buffer : int = 10000, batch_size : int = 500,
+                 flush_interval : float = 1.0, clock : Callable[[], float] = time.time):
+        super().__init__(sink.write_batch if sink else None, audit_records, max_buffer, batch_size, flush_interval)
+        self.sink = sink
+        self._clock = clock
+
+    def record(self, record : AuditRecord) -> None:
+        """Buffer a record of a query, or drop it if the buffer is full.
+
+        Args:
+            record (AuditRecord): The query, it is given the current time.
+        """
+
+        if self.sink is None:
+            return
+
+        self.put(record._replace(logged_at=self._clock()))
+
+def create_audit_sink(engine : Engine) -> Union[FileAuditSink, PostgresAuditSink, None]:
+    """Create the sink chosen by AUDIT_LOG, 'file' or 'postgres'.
+
+    Args:
+        engine (Engine): The engine used by the 'postgres' sink.
+
+    Returns:
+        Union[FileAuditSink, PostgresAuditSink, None]: The sink or None if queries are not audited.
+    """
+
+    kind = os.environ.get('AUDIT_LOG', '').lower()
+    if not kind:
+        return None
+
+    if kind == 'file':
+        return FileAuditSink(
+            os.environ.get('AUDIT_LOG_PATH', 'logs/query_audit.jsonl'),
+            max_bytes=int(os.environ.get('AUDIT_LOG_MAX_BYTES', 50 * 1024 * 1024)),
+            backups=int(os.environ.get('AUDIT_LOG_BACKUPS', 5)),
+            compress=os.environ.get('AUDIT_LOG_COMPRESS', 'true').lower() == 'true'
+            )
+
+    if kind == 'postgres':
+        return PostgresAuditSink(engine)
+
+    raise ValueError(f"Unknown audit log {kind}")
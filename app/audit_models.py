@@ -0,0 +1,22 @@
+from sqlalchemy import Column, BigInteger, Integer, Float, String, Text, DateTime, Identity, Index
+from sqlalchemy.ext.declarative import declarative_base
+
+# kept apart from the game schema's models so the tables are never copied to the replica or granted to the readonly user
+AuditBase = declarative_base()
+
+class QueryAudit(AuditBase):
+    __tablename__ = 'query_log'
+    __table_args__ = (
+        Index('query_log_logged_at_idx', 'logged_at'),
+        Index('query_log_room_code_idx', 'room_code', 'logged_at'),
+        {'schema' : 'audit'}
+        )
+
+    id = Column('query_log_id', BigInteger, Identity(), primary_key=True)
+    logged_at = Column('logged_at', DateTime(timezone=True), nullable=False)
+    room_code = Column('room_code', String(10))
+    user_id = Column('user_id', String(36))
+    query = Column('query', Text, nullable=False)
+    duration = Column('duration', Float, nullable=False)
+    row_count = Column('row_count', Integer)
+    error = Column('error', Text)
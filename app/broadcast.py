@@ -0,0 +1,65 @@
+import os
+import json
+from typing import Any, Dict, List, Union
+from flask_socketio import SocketIO
+from app.scheduler import scheduler
+
+class RoomBroadcaster():
+    """Collects the events sent to a room within a short window and sends them as one 'batch' message.
+
+    The batch is serialised once per room, so every player in the room is sent the same string.
+    """
+
+    def __init__(self, flush_interval : float = 0.05):
+        self.flush_interval = flush_interval
+        self._socketio = None
+
+        # room code -> [event, payload, sid of the player that should not handle the event, room state version]
+        self._pending : Dict[str, List[list]] = {}
+
+    def register_socketio(self, socketio_in : SocketIO) -> None:
+        """Register the socket.io connection manager used to send batches.
+
+        Args:
+            socketio_in (SocketIO): The socket.io connection manager.
+        """
+
+        self._socketio = socketio_in
+
+    def emit(self, room_code : str, event : str, payload : Any = None, skip_sid : Union[str, None] = None, version : Union[int, None] = None) -> None:
+        """Queue an event for every player in a room.
+
+        Args:
+            room_code (str): The code of the room.
+            event (str): The name of the event.
+            payload (Any, optional): The data of the event, it must be JSON serialisable. Defaults to None.
+            skip_sid (Union[str, None], optional): The sid of a player that should ignore the event. Defaults to None.
+            version (Union[int, None], optional): The version of the room's state after the event. Defaults to None.
+        """
+
+        pending = self._pending.get(room_code)
+        if pending is None:
+            pending = self._pending[room_code] = []
+
+            if self.flush_interval > 0:
+                scheduler.call_later(self.flush_interval, self.flush, room_code)
+
+        pending.append([event, payload, skip_sid, version])
+
+        if self.flush_interval <= 0:
+            self.flush(room_code)
+
+    def flush(self, room_code : str) -> None:
+        """Send a room's queued events now.
+
+        Args:
+            room_code (str): The code of the room.
+        """
+
+        events = self._pending.pop(room_code, None)
+        if not events:
+            return
+
+        self._socketio.emit('batch', json.dumps(events), room=room_code)
+
+broadcaster = RoomBroadcaster(flush_interval=float(os.environ.get('BROADCAST_FLUSH_INTERVAL', 0.05)))
@@ -0,0 +1,125 @@
+import random
+from typing import NamedTuple, List, Tuple, Union
+from sqlalchemy.orm import sessionmaker
+from app.game_models import Animal, State, Location, AnimalLocation
+
+class CatalogLocation(NamedTuple):
+    id: int
+    name: str
+    biome: str
+    state_name: str
+    animal_names: Tuple[str, ...]
+
+    def hints(self) -> List[Tuple[str, str]]:
+        """Get the hints for this location.
+
+        Returns:
+            List[Tuple[str, str]]: The name and value of each hint.
+        """
+
+        hints = [("biome", self.biome), ("state name", self.state_name)]
+        hints.extend(("one animal's name", animal_name) for animal_name in self.animal_names)
+        return hints
+
+class LocationCatalog():
+    def __init__(self, session_factory : sessionmaker):
+        self._session_factory = session_factory
+        self._locations = None
+
+        # incremented on every reload so decks know to reshuffle
+        self.version = 0
+
+    @property
+    def locations(self) -> List[CatalogLocation]:
+        """All locations in the game schema, loaded on first use."""
+
+        if self._locations is None:
+            self.reload()
+
+        return self._locations
+
+    def reload(self) -> None:
+        """Load every location with its state and animals in a single query."""
+
+        session = self._session_factory()
+        try:
+            rows = session.query(Location.id, Location.name, Location.biome, State.name, Animal.name) \
+                .join(State, State.id == Location.state_id) \
+                .outerjoin(AnimalLocation, AnimalLocation.location_id == Location.id) \
+                .outerjoin(Animal, Animal.id == AnimalLocation.animal_id) \
+                .order_by(Location.id) \
+                .all()
+
+        finally:
+            session.close()
+
+        locations = {}
+        animal_names = {}
+        for location_id, location_name, biome, state_name, animal_name in rows:
+            if location_id not in locations:
+                locations[location_id] = (location_name, biome, state_name)
+                animal_names[location_id] = []
+
+            if animal_name is not None:
+                animal_names[location_id].append(animal_name)
+
+        self._locations = [
+            CatalogLocation(location_id, location_name, biome, state_name, tuple(animal_names[location_id]))
+            for location_id, (location_name, biome, state_name) in locations.items()
+            ]
+        self.version += 1
+
+    def random_location(self) -> CatalogLocation:
+        """Get a random location.
+
+        Returns:
+            CatalogLocation: The random location.
+        """
+
+        return random.choice(self.locations)
+
+    def deck(self, order : Union[List[int], None] = None) -> 'LocationDeck':
+        """Create a shuffled deck of locations.
+
+        Args:
+            order (Union[List[int], None], optional): The locations left in a deck that is being restored. Defaults to None.
+
+        Returns:
+            LocationDeck: The new deck.
+        """
+
+        return LocationDeck(self, order)
+
+class LocationDeck():
+    def __init__(self, catalog : LocationCatalog, order : Union[List[int], None] = None):
+        self._catalog = catalog
+        # a restored deck keeps its order for the catalog version it is first drawn from
+        self._version = None
+        self._order = list(order) if order else []
+
+    def remaining(self) -> List[int]:
+        """Get the indexes of the locations left in the deck, the last one is drawn next.
+
+        Returns:
+            List[int]: The indexes of the locations left.
+        """
+
+        return list(self._order)
+
+    def draw(self) -> CatalogLocation:
+        """Take the next location, reshuffling once every location has been drawn or the catalog is reloaded.
+
+        Returns:
+            CatalogLocation: The next location.
+        """
+
+        locations = self._catalog.locations
+        if self._version is None:
+            self._version = self._catalog.version
+
+        if not self._order or self._version != self._catalog.version:
+            self._version = self._catalog.version
+            self._order = list(range(len(locations)))
+            random.shuffle(self._order)
+
+        return locations[self._order.pop()]
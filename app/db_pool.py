@@ -0,0 +1,197 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Union
+from eventlet.semaphore import Semaphore
+from psycopg2.extensions import connection, STATUS_READY, TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS, TRANSACTION_STATUS_INERROR
+from psycopg2.pool import PoolError
+
+class GreenConnectionPool():
+    def __init__(self, connect : Callable[[], connection], max_size : int = 20, checkout_timeout : float = 2.0,
+                 reset_session : Union[Callable[[connection], None], None] = None):
+        self._connect = connect
+        # run on a returned connection that a query could have changed, after its transaction is rolled back
+        # a failure closes the connection
+        self._reset_session = reset_session
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+
+        # greenlets switch only when they wait, so the idle connections need no lock
+        # the most recently returned connection is reused first
+        self._idle = deque()
+        # one slot per connection that is checked out
+        self._slots = Semaphore(max_size)
+
+        self.in_use = 0
+        self.waiting = 0
+        self.checkouts = 0
+        self.exhausted = 0
+        self.timeouts = 0
+        self.recycled = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def getconn(self) -> connection:
+        """Check out a connection, waiting for one to be returned if every connection is in use.
+
+        Raises:
+            PoolError: No connection was returned within the checkout timeout.
+
+        Returns:
+            connection: A healthy connection.
+        """
+
+        start = time.perf_counter()
+
+        if not self._slots.acquire(blocking=False):
+            self.exhausted += 1
+            self.waiting += 1
+            try:
+                acquired = self._slots.acquire(timeout=self.checkout_timeout)
+            finally:
+                self.waiting -= 1
+
+            if not acquired:
+                self.timeouts += 1
+                raise PoolError("connection pool exhausted")
+
+        try:
+            conn = self._take_idle()
+            if conn is None:
+                conn = self._connect()
+
+        except BaseException:
+            self._slots.release()
+            raise
+
+        wait_time = time.perf_counter() - start
+        self.checkouts += 1
+        self.wait_time_total += wait_time
+        self.wait_time_max = max(self.wait_time_max, wait_time)
+        self.in_use += 1
+        return conn
+
+    def putconn(self, conn : connection, close : bool = False, reset_session : bool = False) -> None:
+        """Return a connection to the pool. Broken connections are closed instead of reused.
+
+        Args:
+            conn (connection): The connection to return.
+            close (bool, optional): Close the connection instead of reusing it. Defaults to False.
+            reset_session (bool, optional): Reset the session, the connection was used by something that could have changed it. Defaults to False.
+        """
+
+        self.in_use -= 1
+        try:
+            if close or not self._reset(conn, reset_session):
+                self._discard(conn)
+            else:
+                self._idle.append(conn)
+
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def borrow(self) -> Iterator[connection]:
+        """Check out a connection for the duration of a with block. It is always returned, even if the block raises.
+
+        Yields:
+            Iterator[connection]: A healthy connection.
+        """
+
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def stats(self) -> Dict[str, float]:
+        """Get the pool's usage counters.
+
+        Returns:
+            Dict[str, float]: Open, idle, in use and waiting counts, checkout wait times and exhaustion events.
+        """
+
+        return {
+            'max_size' : self.max_size,
+            'open' : self.in_use + len(self._idle),
+            'idle' : len(self._idle),
+            'in_use' : self.in_use,
+            'waiting' : self.waiting,
+            'checkouts' : self.checkouts,
+            'exhausted' : self.exhausted,
+            'timeouts' : self.timeouts,
+            'recycled' : self.recycled,
+            'wait_time_total' : self.wait_time_total,
+            'wait_time_max' : self.wait_time_max
+        }
+
+    def _take_idle(self) -> Union[connection, None]:
+        """Take the most recently used idle connection that is still healthy, None if there is none."""
+
+        while self._idle:
+            conn = self._idle.pop()
+            if self._is_healthy(conn):
+                return conn
+
+            self._discard(conn)
+
+        return None
+
+    @staticmethod
+    def _is_healthy(conn : connection) -> bool:
+        """Check without a round trip that an idle connection is open, outside a transaction and not lost by the server.
+
+        Returns:
+            bool: If the connection can be checked out.
+        """
+
+        # libpq reports an unknown transaction status once the connection is bad
+        return not conn.closed and conn.status == STATUS_READY and conn.get_transaction_status() == TRANSACTION_STATUS_IDLE
+
+    def _reset(self, conn : connection, reset_session : bool) -> bool:
+        """Get a returned connection ready for the next checkout.
+
+        Args:
+            conn (connection): The returned connection.
+            reset_session (bool): Run the session reset after any open transaction is rolled back.
+
+        Returns:
+            bool: If the connection can be reused.
+        """
+
+        if conn.closed:
+            return False
+
+        status = conn.get_transaction_status()
+
+        # still busy or the connection was lost
+        if status not in (TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS, TRANSACTION_STATUS_INERROR):
+            return False
+
+        try:
+            # a query was left in a transaction, possibly after being cancelled
+            # rollback() does nothing in autocommit, where the transaction was opened by the query itself
+            if status != TRANSACTION_STATUS_IDLE:
+                if conn.autocommit:
+                    with conn.cursor() as cur:
+                        cur.execute('ROLLBACK')
+                else:
+                    conn.rollback()
+
+            if reset_session and self._reset_session:
+                self._reset_session(conn)
+
+        except Exception: # pylint: disable=broad-except
+            return False
+
+        return True
+
+    def _discard(self, conn : connection) -> None:
+        """Close a connection that will not be reused."""
+
+        self.recycled += 1
+        try:
+            conn.close()
+
+        except Exception: # pylint: disable=broad-except
+            pass
@@ -1,29 +1,174 @@
 import os
 import json
-import random
-from typing import Tuple, List
+import time
+import uuid
+from typing import Tuple, List, Dict, Set, NamedTuple, Type, Union, Iterable
 from dotenv import load_dotenv
-from eventlet import spawn_after
+from greenlet import getcurrent
+from eventlet.event import Event
+from eventlet.support import psycopg2_patcher
 import psycopg2
-from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extensions import connection, cursor
+from psycopg2.pool import PoolError
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.schema import CreateSchema
 from app.game_models import Base, Animal, State, Location, AnimalLocation
+from app.audit_log import AuditLog, AuditRecord, create_audit_sink
+from app.round_history import RoundHistory
+from app.catalog import LocationCatalog, CatalogLocation
+from app.db_pool import GreenConnectionPool
+from app.metrics import registry, query_seconds, query_errors
+from app.query_cache import QueryCache, normalize_query
+from app.query_cost import QueryCostLimit
+from app.query_executor import QueryExecutor, QueryRejected
+from app.query_guard import check_query
+from app.result_encoding import ResultEncoder, result_row_count
+from app.result_pages import HeldCursor, ServerCursor, fetch_page, streamable_statement
+from app.scheduler import scheduler
+from app.sqlite_replica import SQLiteReplica
+from app.startup import StartupTimer
+
+# libpq does its own socket io, so monkey patching does not reach it
+# a wait callback makes every psycopg2 connection yield to other greenlets while waiting on postgres
+psycopg2_patcher.make_psycopg_green()
+
+class SeedReport(NamedTuple):
+    states: int
+    locations: int
+    animals: int
+    location_animals: int
+    elapsed: float
 
 class GameDatabase():
     def __init__(self):
         # create sqlalchemy engine for use in other modules
         # use psycopg2 connection for user queries
+        # nothing connects to the database until it is first used or warmed up
         load_dotenv()
         self.engine = create_engine(os.environ['DATABASE_URL'])
         self.Session = sessionmaker(self.engine) # pylint: disable=invalid-name
 
-        # get lengths of tables for random fetching later on
-        with open('seed_data/location.json', 'r') as f:
-            locations = json.load(f)['locations']
+        # sent once the game schema exists and the in-memory copies are loaded
+        self._ready = Event()
+        self._warming = None
 
-        self.locations_length = len(locations)
+        # locations and hints are read once and served from memory
+        self.catalog = LocationCatalog(self._ready_session)
+
+        self._query_timeout = 0.5
+
+        # postgres bounds every readonly statement itself, even when this process is busy
+        session_settings = {
+            'default_transaction_read_only' : 'on',
+            'statement_timeout' : int(self._query_timeout * 1000),
+            'work_mem' : os.environ.get('READONLY_WORK_MEM', '4MB'),
+        }
+
+        # only superusers can set temp_file_limit unless the readonly role has been granted it
+        if os.environ.get('READONLY_TEMP_FILE_LIMIT'):
+            session_settings['temp_file_limit'] = os.environ['READONLY_TEMP_FILE_LIMIT']
+
+        self._readonly_session_options = ' '.join(f'-c {name}={value}' for name, value in session_settings.items())
+        self._readonly_conn_pool = GreenConnectionPool(
+            self._connect_readonly,
+            max_size=int(os.environ.get('READONLY_POOL_SIZE', 20)),
+            checkout_timeout=float(os.environ.get('READONLY_POOL_TIMEOUT', 2)),
+            reset_session=self._reset_readonly_session
+            )
+
+        # budgets for each page of results sent to a player
+        self._max_rows = int(os.environ.get('QUERY_MAX_ROWS', 500))
+        self._max_bytes = int(os.environ.get('QUERY_MAX_BYTES', 256 * 1024))
+
+        # truncated results keep their cursor open for the next page until the round ends or this many seconds pass
+        self._cursor_timeout = float(os.environ.get('QUERY_CURSOR_TIMEOUT', 30))
+        self._held_cursors : Dict[uuid.UUID, HeldCursor] = {}
+        # each held cursor keeps a readonly connection, so only a part of the pool can be held and the oldest cursor makes way for a new one
+        self._max_held_cursors = max(1, int(os.environ.get('QUERY_MAX_HELD_CURSORS', int(os.environ.get('READONLY_POOL_SIZE', 20)) // 4)))
+
+        # pages are encoded once, before they are cached, with rows or columns that are compressed when large
+        self._result_encoder = ResultEncoder(os.environ.get('RESULT_ENCODING', 'rows'), int(os.environ.get('RESULT_COMPRESS_THRESHOLD', 8192)))
+
+        # the game schema is read-only, so identical queries have identical results
+        self.query_cache = QueryCache(max_size=int(os.environ.get('QUERY_CACHE_SIZE', 256)), ttl=float(os.environ.get('QUERY_CACHE_TTL', 30)))
+
+        # optional limits on the planner's estimates, 0 turns a limit off
+        self.query_cost_limit = QueryCostLimit(max_cost=float(os.environ.get('QUERY_MAX_COST', 0)), max_rows=float(os.environ.get('QUERY_MAX_ESTIMATED_ROWS', 0)))
+
+        # player queries can run against an in-memory copy of the game schema in this worker instead of postgres
+        self._replica = None
+        if os.environ.get('QUERY_BACKEND', 'postgres').lower() == 'sqlite':
+            self._replica = SQLiteReplica(timeout=self._query_timeout)
+
+        # a separate cap on queries running at once, the rest wait in a queue where rooms take turns
+        self._query_executor = QueryExecutor(
+            workers=int(os.environ.get('QUERY_WORKERS', os.environ.get('READONLY_POOL_SIZE', 20))),
+            max_queue=int(os.environ.get('QUERY_QUEUE_SIZE', 200)),
+            clock=scheduler.clock
+            )
+
+        # every player query is recorded for review, written in batches by a background task
+        self.audit_log = AuditLog(
+            create_audit_sink(self.engine),
+            max_buffer=int(os.environ.get('AUDIT_BUFFER_SIZE', 10000)),
+            batch_size=int(os.environ.get('AUDIT_BATCH_SIZE', 500)),
+            flush_interval=float(os.environ.get('AUDIT_FLUSH_INTERVAL', 1))
+            )
+
+        # round results are kept in the history schema, inserted in batches by a background task
+        self.round_history = RoundHistory(
+            self.engine if os.environ.get('ROUND_HISTORY', 'true').lower() == 'true' else None,
+            max_buffer=int(os.environ.get('ROUND_HISTORY_BUFFER_SIZE', 1000)),
+            batch_size=int(os.environ.get('ROUND_HISTORY_BATCH_SIZE', 100)),
+            flush_interval=float(os.environ.get('ROUND_HISTORY_FLUSH_INTERVAL', 5))
+            )
+
+        self._register_metrics()
+
+    def ensure_ready(self) -> None:
+        """Create the game schema if it does not exist and load the in-memory copies of it, once.
+
+        Other greenlets that need the database wait for the one that is warming it up.
+        """
+
+        if self._ready.ready():
+            return
+
+        if self._warming is not None:
+            # loading seed data reloads the catalog from inside the warm up
+            if self._warming is getcurrent():
+                return
+
+            self._ready.wait()
+            return
+
+        self._warming = getcurrent()
+        try:
+            self._warm_up()
+
+        except BaseException as e:
+            # waiting greenlets get the error, the next use tries again
+            failed, self._ready = self._ready, Event()
+            failed.send_exception(e)
+            raise
+
+        finally:
+            self._warming = None
+
+        self._ready.send()
+
+    def warm_up(self) -> None:
+        """Get the database ready in the background after the worker has started accepting connections."""
+
+        try:
+            self.ensure_ready()
+
+        except Exception as e: # pylint: disable=broad-except
+            print("Database warm up failed, it is retried on first use:", e)
+
+    def _warm_up(self) -> None:
+        timer = StartupTimer()
 
         # if the schema 'game' does not exist, create the schema and its basic layout
         if not self.engine.dialect.has_schema(self.engine, 'game'):
@@ -37,101 +182,502 @@ class GameDatabase():
 
             # allow readonly user to access all tables in schema after they are created
             self.engine.execute("GRANT SELECT ON ALL TABLES IN SCHEMA game TO readonly;")
+            timer.mark('schema')
 
             self.load_seed_data()
+            timer.mark('seed data')
 
-        self._readonly_conn_pool = ThreadedConnectionPool(minconn=1, maxconn=20, dsn=os.environ['READONLY_DATABASE_URL'])
-        self._query_timeout = 0.5
+        else:
+            timer.mark('schema check')
+
+            # location counts come from the catalog's query, the seed file is only read when seeding
+            self.catalog.reload()
+            timer.mark(f'catalog ({len(self.catalog.locations)} locations)')
+
+            if self._replica:
+                self._replica.load(self.Session)
+                timer.mark('sqlite replica')
+
+        timer.report("Database ready")
+
+    def _ready_session(self) -> Session:
+        """Create a session once the game schema is ready, used by the catalog."""
 
-    def execute_user_input(self, query : str) -> dict:
-        """Execute a query from user input.
+        self.ensure_ready()
+        return self.Session()
+
+    def execute_user_input(self, query : str, cursor_owner : Union[uuid.UUID, None] = None, room_code : Union[str, None] = None, deadline : Union[float, None] = None) -> dict:
+        """Execute a query from user input. Results are cached and identical queries that are running at the same time share one execution.
+        Queries that miss the cache wait for a slot in the query executor.
 
         Args:
             query (str): The query input from the user.
+            cursor_owner (Union[uuid.UUID, None], optional): The user that can read the rest of a truncated result with fetch_next_page. Defaults to None.
+            room_code (Union[str, None], optional): The room the query is for, rooms take turns in the executor's queue. Defaults to None.
+            deadline (Union[float, None], optional): The scheduler clock time after which the result is of no use. Defaults to None.
+
+        Returns:
+            dict: The first page of the results of the query, with 'truncated' set if there are more rows,
+                or 'rate_limited' set if the executor was too busy to run it. 'db_time' is the seconds this caller's query ran
+                once it had a slot in the executor, 0 if its result came from the cache or an identical query.
+        """
+
+        self.ensure_ready()
+
+        # a new query replaces the user's previous result
+        if cursor_owner is not None:
+            self.release_cursor(cursor_owner)
+
+        execute = self._execute_replica if self._replica else self._execute_readonly
+        db_time = 0.0
+
+        def run() -> dict:
+            nonlocal db_time
+            run_start = time.perf_counter()
+            try:
+                return execute(query, cursor_owner)
+
+            finally:
+                db_time = time.perf_counter() - run_start
+
+        start = time.perf_counter()
+        try:
+            returning = self.query_cache.get_or_execute(query,
+                lambda: self._result_encoder.encode(self._query_executor.run(room_code, deadline, run)))
+
+        except QueryRejected as e:
+            # identical queries waiting on this one run it themselves, so only this caller is turned away
+            query_errors.labels('busy').inc()
+            returning = {'error' : str(e), 'rate_limited' : True, 'limit' : 'busy', 'retry_after' : e.retry_after}
+
+        duration = time.perf_counter() - start
+        if not returning.get('rate_limited'):
+            query_seconds.observe(duration)
+
+        self.audit_log.record(AuditRecord(room_code, cursor_owner and str(cursor_owner), normalize_query(query), duration, result_row_count(returning), returning.get('error')))
+
+        # the result can be shared with the cache and other callers, so the time goes on a copy
+        return {**returning, 'db_time' : db_time}
+
+    def fetch_next_page(self, cursor_owner : uuid.UUID) -> dict:
+        """Get the next page of the user's last truncated result.
+
+        Args:
+            cursor_owner (uuid.UUID): The user that ran the query.
 
         Returns:
-            dict: The result of cur.fetchall() after the query; the results of the query.
+            dict: The next page of the results, with 'truncated' set if there are more rows.
         """
 
+        held = self._held_cursors.get(cursor_owner)
+        if not held:
+            return {'error' : "The rest of this result is no longer available, run the query again"}
+
+        if held.reading:
+            return {'error' : "The next page of this result is still being read"}
+
         returning = {}
 
-        conn = self._readonly_conn_pool.getconn()
-        with conn.cursor() as cur:
+        # the read lets other greenlets run, which can release the cursor meanwhile
+        held.reading = True
+        try:
+            # postgres times out each FETCH itself
+            if self._replica:
+                self._replica.start_timer(held.conn)
+
+            rows, held.next_row = fetch_page(held.cursor, held.next_row, self._max_rows, self._max_bytes)
+            returning['result'] = rows
+            returning['columns'] = held.columns
+            returning['offset'] = held.offset
+            returning['truncated'] = held.next_row is not None
+            held.offset += len(rows)
+
+        except Exception as e: # pylint: disable=broad-except
+            returning['error'] = self._query_error(e)
+
+        finally:
+            held.reading = False
+
+        if held.released:
+            self._close_cursor(held.conn, held.cursor, held.reset_session)
+
+        elif not returning.get('truncated'):
+            self.release_cursor(cursor_owner, held)
+
+        return self._result_encoder.encode(returning)
+
+    def release_cursor(self, cursor_owner : uuid.UUID, held : Union[HeldCursor, None] = None) -> None:
+        """Close a user's held cursor and return its connection to the pool.
+
+        Args:
+            cursor_owner (uuid.UUID): The user that ran the query.
+            held (Union[HeldCursor, None], optional): Only release the cursor if it is still this one. Defaults to None.
+        """
+
+        current = self._held_cursors.get(cursor_owner)
+        if not current or (held is not None and current is not held):
+            return
+
+        del self._held_cursors[cursor_owner]
+        current.expiry.cancel()
+
+        # closing a cursor that is being read fails, so the read closes it once it ends
+        if current.reading:
+            current.released = True
+            return
+
+        self._close_cursor(current.conn, current.cursor, current.reset_session)
+
+    def release_cursors(self, cursor_owners : Iterable[uuid.UUID]) -> None:
+        """Close the held cursors of several users, used when a round ends.
+
+        Args:
+            cursor_owners (Iterable[uuid.UUID]): The users whose cursors are closed.
+        """
+
+        for cursor_owner in cursor_owners:
+            self.release_cursor(cursor_owner)
+
+    def _execute_readonly(self, query : str, cursor_owner : Union[uuid.UUID, None] = None) -> dict:
+        """Execute a query on a readonly connection.
+
+        Args:
+            query (str): The query input from the user.
+            cursor_owner (Union[uuid.UUID, None], optional): The user that keeps the cursor if the result is truncated. Defaults to None.
+
+        Returns:
+            dict: The first page of the results of the query.
+        """
+
+        returning = {}
+
+        # statements that would outlive the query on the autocommit session are turned away before a connection is taken
+        check = check_query(query)
+        if check.rejection:
+            query_errors.labels('not_allowed').inc()
+            return {'error' : check.rejection}
+
+        try:
+            conn = self._readonly_conn_pool.getconn()
+
+        except PoolError:
+            query_errors.labels('busy').inc()
+            return {'error' : "The server is busy, try your query again"}
+
+        # turn away queries the planner expects to be too expensive for the price of planning them
+        if self.query_cost_limit.enabled:
+            try:
+                rejection = self.query_cost_limit.check(conn, query)
+
+            except BaseException:
+                self._readonly_conn_pool.putconn(conn)
+                raise
+
+            if rejection:
+                self._readonly_conn_pool.putconn(conn)
+                query_errors.labels('too_expensive').inc()
+                return {'error' : rejection}
+
+        # stream single statements that allow it from a server-side cursor so only one page is sent at a time
+        # the cursor lives in a transaction, which stays open while its owner pages through it
+        # other queries run in autocommit on a plain cursor, which returns the result of the last statement
+        cur = None
+        next_row = None
+        try:
+            cur = conn.cursor()
+            statement = streamable_statement(query)
+            if statement is not None:
+                cur = ServerCursor(cur, min(self._max_rows + 1, 1000))
+                query = statement
+
             # attempt to execute query, ready to catch error if user input is bad
-            query_timeout = spawn_after(self._query_timeout, conn.cancel)
+            cur.execute(query)
+            returning['result'], next_row = fetch_page(cur, None, self._max_rows, self._max_bytes)
+            returning['columns'] = [desc[0] for desc in cur.description]
+            returning['offset'] = 0
+            returning['truncated'] = next_row is not None
+
+        except Exception as e: # pylint: disable=broad-except
+            returning['error'] = self._query_error(e)
+
+        self._hold_or_close(returning, HeldCursor(conn, cur, returning.get('columns'), next_row, check.changes_session), cursor_owner)
+        return returning
+
+    def _execute_replica(self, query : str, cursor_owner : Union[uuid.UUID, None] = None) -> dict:
+        """Execute a query on the in-memory SQLite copy of the game schema.
+
+        Args:
+            query (str): The query input from the user.
+            cursor_owner (Union[uuid.UUID, None], optional): The user that keeps the cursor if the result is truncated. Defaults to None.
+
+        Returns:
+            dict: The first page of the results of the query.
+        """
+
+        returning = {}
+
+        conn = self._replica.getconn()
+        cur = None
+        next_row = None
+        try:
+            # sqlite steps through the result as it is read, so every row is read lazily
+            cur = conn.cursor()
+            self._replica.start_timer(conn)
+            cur.execute(query)
+            returning['result'], next_row = fetch_page(cur, None, self._max_rows, self._max_bytes)
+            returning['columns'] = [desc[0] for desc in cur.description or ()]
+            returning['offset'] = 0
+            returning['truncated'] = next_row is not None
+
+        except Exception as e: # pylint: disable=broad-except
+            returning['error'] = self._query_error(e)
+
+        self._hold_or_close(returning, HeldCursor(conn, cur, returning.get('columns'), next_row), cursor_owner)
+        return returning
+
+    def _hold_or_close(self, returning : dict, held : HeldCursor, cursor_owner : Union[uuid.UUID, None]) -> None:
+        """Keep the cursor of a truncated result for its owner's next page, otherwise close it.
+
+        Args:
+            returning (dict): The first page of the results of the query.
+            held (HeldCursor): The connection and cursor the query ran on, with the first row of the next page.
+            cursor_owner (Union[uuid.UUID, None]): The user that keeps the cursor if the result is truncated.
+        """
+
+        if returning.get('truncated') and cursor_owner is not None:
+            # held cursors are kept in the order they were made
+            while len(self._held_cursors) >= self._max_held_cursors:
+                self.release_cursor(next(iter(self._held_cursors)))
+
+            held.offset = len(returning['result'])
+            held.expiry = scheduler.call_later(self._cursor_timeout, self.release_cursor, cursor_owner, held)
+            self._held_cursors[cursor_owner] = held
+        else:
+            self._close_cursor(held.conn, held.cursor, held.reset_session)
+
+    def _query_error(self, e : Exception) -> str:
+        """Count a query that failed and get the message shown to the player.
+
+        Args:
+            e (Exception): The exception raised by the query.
+
+        Returns:
+            str: The error message.
+        """
+
+        if isinstance(e, psycopg2.errors.QueryCanceled) or (self._replica and self._replica.is_timeout(e)): # pylint: disable=no-member
+            query_errors.labels('timeout').inc()
+            return f"canceling statement due to statement timeout: execution was longer than {self._query_timeout} seconds"
+
+        query_errors.labels('error').inc()
+        return str(e)
+
+    def _close_cursor(self, conn : connection, cur : Union[cursor, ServerCursor, None], reset_session : bool = False) -> None:
+        """Close a cursor and return the connection to the pool, which ends a transaction left open by a server-side cursor.
 
+        Args:
+            conn (connection): The readonly connection.
+            cur (Union[cursor, ServerCursor, None]): The cursor to close.
+            reset_session (bool, optional): If the query could have changed the session, which is then reset. Defaults to False.
+        """
+
+        if self._replica:
             try:
-                cur.execute(query)
-                returning['result'] = list(cur.fetchall())
-                returning['columns'] = [desc[0] for desc in cur.description]
+                if cur is not None:
+                    cur.close()
+
+            except Exception: # pylint: disable=broad-except
+                self._replica.putconn(conn, close=True)
+                return
+
+            self._replica.putconn(conn)
+            return
 
-            except psycopg2.errors.QueryCanceled: # pylint: disable=no-member
-                returning['error'] = "canceling statement due to statement timeout: execution was longer than 0.5 seconds"
+        try:
+            if cur is not None:
+                cur.close()
 
-            except Exception as e: # pylint: disable=broad-except
-                returning['error'] = str(e)
+        except Exception: # pylint: disable=broad-except
+            # the connection is broken, do not reuse it
+            self._readonly_conn_pool.putconn(conn, close=True)
+            return
 
-            else:
-                query_timeout.cancel()
+        self._readonly_conn_pool.putconn(conn, reset_session=reset_session)
 
-            conn.rollback()
-            return returning
+    def _connect_readonly(self) -> connection:
+        """Open a readonly connection. Its limits are set by the server from the connection options.
 
-    def get_random_location(self) -> Tuple[Location, List[Tuple]]:
+        Queries run in autocommit, so a query that returns its whole result takes one round trip and leaves nothing to roll back.
+
+        Returns:
+            connection: The new connection.
+        """
+
+        conn = psycopg2.connect(os.environ['READONLY_DATABASE_URL'], options=self._readonly_session_options)
+        conn.autocommit = True
+        return conn
+
+    @staticmethod
+    def _reset_readonly_session(conn : connection) -> None:
+        """Undo what a query could have left in its session, such as prepared statements, cursors and advisory locks.
+        Settings go back to the connection options.
+
+        Args:
+            conn (connection): A returned readonly connection that is not in a transaction.
+        """
+
+        with conn.cursor() as cur:
+            cur.execute('DISCARD ALL')
+
+    def get_pool_stats(self) -> Dict[str, float]:
+        """Get the readonly connection pool's usage counters.
+
+        Returns:
+            Dict[str, float]: Open, idle, in use and waiting counts, checkout wait times and exhaustion events.
+        """
+
+        return self._readonly_conn_pool.stats()
+
+    def _register_metrics(self) -> None:
+        """Export the readonly pool's, query cache's, query executor's, audit log's and round history's counters on the metrics endpoint."""
+
+        pool = self._readonly_conn_pool
+        registry.gauge('sqlguess_readonly_pool_connections', "Readonly connections by state.", lambda: {(state,) : pool.stats()[state] for state in ('in_use', 'idle')}, ['state'])
+        registry.gauge('sqlguess_readonly_pool_waiting', "Queries waiting for a readonly connection.", lambda: {() : pool.waiting})
+        registry.collected_counter('sqlguess_readonly_pool_wait_seconds_total', "Time queries spent waiting for a readonly connection.", lambda: {() : pool.wait_time_total})
+        registry.collected_counter('sqlguess_readonly_pool_events_total', "Readonly pool checkouts, exhaustions, timeouts and recycled connections.",
+            lambda: {(event,) : pool.stats()[event] for event in ('checkouts', 'exhausted', 'timeouts', 'recycled')}, ['event'])
+
+        cache = self.query_cache
+        registry.collected_counter('sqlguess_query_cache_lookups_total', "Query cache lookups by result.", lambda: {(result,) : cache.stats()[result] for result in ('hits', 'misses', 'coalesced')}, ['result'])
+        registry.gauge('sqlguess_query_cache_entries', "Results in the query cache.", lambda: {() : cache.stats()['size']})
+
+        executor = self._query_executor
+        registry.gauge('sqlguess_query_executor_queries', "Queries running and waiting in the query executor.", lambda: {('running',) : executor.running, ('queued',) : executor.queued}, ['state'])
+        registry.gauge('sqlguess_query_executor_workers', "Queries the query executor runs at once.", lambda: {() : executor.workers})
+
+        audit_log = self.audit_log
+        registry.gauge('sqlguess_audit_buffered_records', "Query audit records waiting to be written.", lambda: {() : audit_log.buffered})
+
+        round_history = self.round_history
+        registry.gauge('sqlguess_round_history_buffered_rounds', "Ended rounds waiting to be written to the history.", lambda: {() : round_history.buffered})
+
+    def get_random_location(self) -> Tuple[CatalogLocation, List[Tuple]]:
         """Get a random location and a list of hints.
 
         Returns:
-            Tuple[Location, List[Tuple]]: The random location and a list of hints for it.
+            Tuple[CatalogLocation, List[Tuple]]: The random location and a list of hints for it.
+        """
+
+        location = self.catalog.random_location()
+        return location, location.hints()
+
+    def load_seed_data(self, seed_path : str = 'seed_data/location.json') -> SeedReport:
+        """Create seed data for the tables. Rows that already exist are skipped, so it is safe to re-run.
+
+        Args:
+            seed_path (str, optional): The JSON file with the locations to load. Defaults to 'seed_data/location.json'.
+
+        Returns:
+            SeedReport: The number of rows inserted into each table and the seconds it took.
         """
 
-        random_location_id = random.randint(1, self.locations_length)
+        start = time.perf_counter()
+
+        with open(seed_path, 'r', encoding='utf-8') as f:
+            locations_data = json.load(f)['locations']
 
         session = self.Session()
-        location = session.query(Location).filter(Location.id == random_location_id).one()
-        state_name = session.query(State).filter(State.id == location.state_id).one().name
+        try:
+            state_ids, states_loaded = self._insert_missing_names(session, State, {location["state"] for location in locations_data})
+            animal_ids, animals_loaded = self._insert_missing_names(session, Animal, {animal_name for location in locations_data for animal_name in location["animals"]})
+            location_ids, locations_loaded = self._insert_missing_locations(session, locations_data, state_ids)
+            pairs_loaded = self._insert_missing_location_animals(session, locations_data, location_ids, animal_ids)
+            session.commit()
 
-        hints = [("biome", location.biome), ("state name", state_name)]
-        for animal_location in session.query(AnimalLocation).filter(AnimalLocation.location_id == location.id).all():
-            animal = session.query(Animal).filter(Animal.id == animal_location.animal_id).one()
-            hints.append(("one animal's name", animal.name))
+        finally:
+            session.close()
 
-        session.close()
+        report = SeedReport(states_loaded, locations_loaded, animals_loaded, pairs_loaded, time.perf_counter() - start)
+        print("Seed data loaded:", report)
 
-        return location, hints
+        self.catalog.reload()
+        self.query_cache.invalidate()
+        self.query_cost_limit.invalidate()
 
-    def load_seed_data(self) -> None:
-        """Create seed data for the tables."""
+        if self._replica:
+            self._replica.load(self.Session)
+        return report
 
-        with open('seed_data/location.json', 'r') as f:
-            locations_data = json.load(f)['locations']
+    @staticmethod
+    def _insert_missing_names(session : Session, model : Union[Type[State], Type[Animal]], names : Set[str]) -> Tuple[Dict[str, int], int]:
+        """Insert the names that are not in a table yet in one batch.
+
+        Args:
+            session (Session): The session to insert with.
+            model (Union[Type[State], Type[Animal]]): The model of the table, which has a name and an id.
+            names (Set[str]): Every name that should be in the table.
+
+        Returns:
+            Tuple[Dict[str, int], int]: The id of every name in the table and the number of names inserted.
+        """
 
-            session = self.Session()
-            for location in locations_data:
-                state_name = location["state"]
+        ids = dict(session.query(model.name, model.id))
+        missing_names = sorted(names - ids.keys())
 
-                state = session.query(State).filter(State.name == state_name).scalar()
+        if missing_names:
+            session.bulk_insert_mappings(model, [{'name' : name} for name in missing_names])
+            ids = dict(session.query(model.name, model.id))
 
-                if not state:
-                    state = State(name=state_name)
-                    session.add(state)
-                    session.commit()
-                    session.refresh(state)
+        return ids, len(missing_names)
 
-                insert_location = Location(name=location["name"], biome=location["biome"], state_id=state.id)
-                session.add(insert_location)
-                session.commit()
-                session.refresh(insert_location)
+    @staticmethod
+    def _insert_missing_locations(session : Session, locations_data : List[dict], state_ids : Dict[str, int]) -> Tuple[Dict[str, int], int]:
+        """Insert the locations that are not in the location table yet in one batch.
 
-                for animal_name in location["animals"]:
-                    animal = session.query(Animal).filter(Animal.name == animal_name).scalar()
+        Args:
+            session (Session): The session to insert with.
+            locations_data (List[dict]): The locations from the seed file.
+            state_ids (Dict[str, int]): The id of every state.
 
-                    if not animal:
-                        animal = Animal(name=animal_name)
-                        session.add(animal)
-                        session.commit()
-                        session.refresh(animal)
+        Returns:
+            Tuple[Dict[str, int], int]: The id of every location name and the number of locations inserted.
+        """
+
+        # locations are identified by name since that is what players guess
+        location_ids = dict(session.query(Location.name, Location.id))
+        new_locations = {}
+        for location in locations_data:
+            if location["name"] not in location_ids:
+                new_locations[location["name"]] = {'name' : location["name"], 'biome' : location["biome"], 'state_id' : state_ids[location["state"]]}
+
+        if new_locations:
+            session.bulk_insert_mappings(Location, list(new_locations.values()))
+            location_ids = dict(session.query(Location.name, Location.id))
+
+        return location_ids, len(new_locations)
+
+    @staticmethod
+    def _insert_missing_location_animals(session : Session, locations_data : List[dict], location_ids : Dict[str, int], animal_ids : Dict[str, int]) -> int:
+        """Insert the pairs of location and animal that are not in the animal_location table yet in one batch.
+
+        Args:
+            session (Session): The session to insert with.
+            locations_data (List[dict]): The locations from the seed file.
+            location_ids (Dict[str, int]): The id of every location name.
+            animal_ids (Dict[str, int]): The id of every animal name.
+
+        Returns:
+            int: The number of pairs inserted.
+        """
 
-                    session.add(AnimalLocation(location_id=insert_location.id, animal_id=animal.id))
+        existing_pairs = set(session.query(AnimalLocation.location_id, AnimalLocation.animal_id))
+        new_pairs = {}
+        for location in locations_data:
+            for animal_name in location["animals"]:
+                pair = (location_ids[location["name"]], animal_ids[animal_name])
+                if pair not in existing_pairs:
+                    new_pairs[pair] = {'location_id' : pair[0], 'animal_id' : pair[1]}
 
-        # commit anything left (last location's rows)
-        session.commit()
+        session.bulk_insert_mappings(AnimalLocation, list(new_pairs.values()))
+        return len(new_pairs)
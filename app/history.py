@@ -0,0 +1,23 @@
+from typing import Union
+from flask import Blueprint, jsonify, request
+from app import game_database
+
+history = Blueprint('history', __name__, url_prefix='/history')
+
+# the most rounds a single request can read
+MAX_ROUNDS = 100
+
+def _rounds(room_code : Union[str, None] = None):
+    if not game_database.round_history.enabled:
+        return jsonify(error="Round history is turned off"), 404
+
+    limit = min(max(request.args.get('limit', 20, type=int), 1), MAX_ROUNDS)
+    return jsonify(rounds=game_database.round_history.recent_rounds(limit, room_code))
+
+@history.route('/recent')
+def recent():
+    return _rounds()
+
+@history.route('/room/<room_code>')
+def room(room_code):
+    return _rounds(room_code)
@@ -0,0 +1,43 @@
+from sqlalchemy import Column, Integer, Float, String, Boolean, DateTime, ForeignKey, PrimaryKeyConstraint, Index, JSON
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.declarative import declarative_base
+
+# kept apart from the game schema's models so the tables are never copied to the replica or granted to the readonly user
+HistoryBase = declarative_base()
+
+class RoundResult(HistoryBase):
+    __tablename__ = 'round_result'
+    __table_args__ = (
+        Index('round_result_ended_at_idx', 'ended_at'),
+        Index('round_result_room_code_idx', 'room_code', 'ended_at'),
+        {'schema' : 'history'}
+        )
+
+    # made when the round ends so its players can be inserted in the same batch
+    id = Column('round_id', UUID(as_uuid=True), primary_key=True)
+    room_code = Column('room_code', String(10), nullable=False)
+    room_instance_id = Column('room_instance_id', UUID(as_uuid=True), nullable=False)
+    round_number = Column('round_number', Integer, nullable=False)
+    location_id = Column('location_id', Integer)
+    location_name = Column('location_name', String(50), nullable=False)
+    hints = Column('hints', JSON, nullable=False)
+    started_at = Column('started_at', DateTime(timezone=True), nullable=False)
+    ended_at = Column('ended_at', DateTime(timezone=True), nullable=False)
+
+class RoundPlayer(HistoryBase):
+    __tablename__ = 'round_player'
+    __table_args__ = (
+        PrimaryKeyConstraint('round_id', 'rank'),
+        Index('round_player_user_id_idx', 'user_id'),
+        {'schema' : 'history'}
+        )
+
+    round_id = Column('round_id', UUID(as_uuid=True), ForeignKey(RoundResult.id, ondelete='CASCADE'))
+    rank = Column('rank', Integer)
+    user_id = Column('user_id', UUID(as_uuid=True), nullable=False)
+    display_name = Column('display_name', String(50), nullable=False)
+    query_count = Column('query_count', Integer, nullable=False)
+    guessed_correctly = Column('guessed_correctly', Boolean, nullable=False)
+    # seconds from the start of the round to the correct guess
+    guessed_after = Column('guessed_after', Float)
+    db_time = Column('db_time', Float, nullable=False)
@@ -0,0 +1,235 @@
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+# seconds, from a cached query to a round timer that fired late
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+def _format_labels(labelnames : Tuple[str, ...], labelvalues : Tuple[str, ...]) -> str:
+    if not labelnames:
+        return ''
+
+    pairs = []
+    for name, value in zip(labelnames, labelvalues):
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+
+    return '{' + ','.join(pairs) + '}'
+
+class Metric():
+    """A named metric with a child for every combination of label values.
+
+    Updates only touch the child's numbers, so recording costs the same however much has been recorded.
+    Green threads do not switch in the middle of an update, so no lock is needed.
+    """
+
+    type_name = 'untyped'
+
+    def __init__(self, name : str, description : str, labelnames : Iterable[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def labels(self, *labelvalues : str):
+        """Get the child for some label values, created the first time they are used.
+
+        Returns:
+            The child, which is updated like a metric without labels.
+        """
+
+        child = self._children.get(labelvalues)
+        if child is None:
+            child = self._children[labelvalues] = self._new_child()
+
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """Get the current values of the metric.
+
+        Returns:
+            List[Tuple[str, str, float]]: The name, formatted labels and value of each sample.
+        """
+
+        raise NotImplementedError
+
+class _CounterChild():
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount : float = 1) -> None:
+        self.value += amount
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount : float = 1) -> None:
+        self._children[()].inc(amount)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        return [(self.name, _format_labels(self.labelnames, labelvalues), child.value) for labelvalues, child in self._children.items()]
+
+class _HistogramChild():
+    def __init__(self, buckets : Tuple[float, ...]):
+        self._buckets = buckets
+        # the last count is for values above every bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value : float) -> None:
+        self.counts[bisect_left(self._buckets, value)] += 1
+        self.sum += value
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name : str, description : str, labelnames : Iterable[str] = (), buckets : Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, description, labelnames)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value : float) -> None:
+        self._children[()].observe(value)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        samples = []
+        for labelvalues, child in self._children.items():
+            labels = _format_labels(self.labelnames, labelvalues)
+
+            # buckets are cumulative when exported
+            total = 0
+            for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+                total += count
+                bucket_labels = _format_labels(self.labelnames + ('le',), labelvalues + ('+Inf' if bound == float('inf') else repr(float(bound)),))
+                samples.append((self.name + '_bucket', bucket_labels, total))
+
+            samples.append((self.name + '_sum', labels, child.sum))
+            samples.append((self.name + '_count', labels, total))
+
+        return samples
+
+class Gauge(Metric):
+    """A metric whose values are read from a callback when the metrics are collected."""
+
+    type_name = 'gauge'
+
+    def __init__(self, name : str, description : str, collect : Callable[[], Dict[Tuple[str, ...], float]], labelnames : Iterable[str] = ()):
+        super().__init__(name, description, labelnames)
+        self._collect = collect
+
+    def _new_child(self) -> None:
+        return None
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        return [(self.name, _format_labels(self.labelnames, labelvalues), value) for labelvalues, value in self._collect().items()]
+
+class CollectedCounter(Gauge):
+    """A counter kept by another object, read from a callback when the metrics are collected."""
+
+    type_name = 'counter'
+
+class MetricsRegistry():
+    def __init__(self):
+        self._metrics : Dict[str, Metric] = {}
+        # counts renders, so values shared by several gauges are collected once per scrape
+        self._scrape = 0
+
+    def register(self, metric : Metric) -> Metric:
+        """Add a metric to the ones that are exported.
+
+        Args:
+            metric (Metric): The metric.
+
+        Returns:
+            Metric: The same metric.
+        """
+
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name : str, description : str, labelnames : Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, description, labelnames))
+
+    def histogram(self, name : str, description : str, labelnames : Iterable[str] = (), buckets : Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, description, labelnames, buckets))
+
+    def gauge(self, name : str, description : str, collect : Callable[[], Dict[Tuple[str, ...], float]], labelnames : Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, description, collect, labelnames))
+
+    def collected_counter(self, name : str, description : str, collect : Callable[[], Dict[Tuple[str, ...], float]], labelnames : Iterable[str] = ()) -> CollectedCounter:
+        return self.register(CollectedCounter(name, description, collect, labelnames))
+
+    def once_per_scrape(self, collect : Callable[[], Any]) -> Callable[[], Any]:
+        """Wrap a callback that several gauges read so that it is only called once each time the metrics are rendered.
+
+        Args:
+            collect (Callable[[], Any]): The callback.
+
+        Returns:
+            Callable[[], Any]: A callback that returns the value collected during the current render.
+        """
+
+        cached = {}
+
+        def collect_once() -> Any:
+            if self._scrape not in cached:
+                cached.clear()
+                cached[self._scrape] = collect()
+
+            return cached[self._scrape]
+
+        return collect_once
+
+    def render(self) -> str:
+        """Export every metric in the Prometheus text format.
+
+        Returns:
+            str: The metrics.
+        """
+
+        self._scrape += 1
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = metric.samples()
+
+            except Exception as e: # pylint: disable=broad-except
+                # one failing gauge should not hide the other metrics
+                lines.append(f"# {metric.name} could not be collected: {e}".replace('\n', ' '))
+                continue
+
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{labels} {float(value)!r}")
+
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+socket_event_seconds = registry.histogram('sqlguess_socket_event_seconds', "Time spent handling socket.io events.", ['event'])
+socket_event_errors = registry.counter('sqlguess_socket_event_errors_total', "Socket.io event handlers that raised an exception.", ['event'])
+query_seconds = registry.histogram('sqlguess_query_seconds', "Time to answer a player's query, including cache hits.")
+query_queue_wait_seconds = registry.histogram('sqlguess_query_queue_wait_seconds', "Time queries waited for a slot in the query executor.")
+query_queue_rejected = registry.counter('sqlguess_query_queue_rejected_total', "Queries turned away by the query executor, by reason.", ['reason'])
+query_errors = registry.counter('sqlguess_query_errors_total', "Player queries that did not return rows.", ['reason'])
+hint_lateness_seconds = registry.histogram('sqlguess_hint_lateness_seconds', "How long after its scheduled time a hint was sent.")
+scheduler_errors = registry.counter('sqlguess_scheduler_errors_total', "Scheduled calls that raised an exception.")
+queries_limited = registry.counter('sqlguess_queries_limited_total', "Queries turned away by a rate or database time limit, by limit.", ['limit'])
+reaped_users = registry.counter('sqlguess_reaped_users_total', "Users removed from rooms after being disconnected for too long.")
+audit_records = registry.counter('sqlguess_audit_records_total', "Query audit records by whether they were written, dropped because the buffer was full or lost when a batch failed.", ['result'])
+round_history_records = registry.counter('sqlguess_round_history_records_total', "Ended rounds by whether they were written to the history, dropped because the buffer was full or lost when a batch failed.", ['result'])
+rooms_closed = registry.counter('sqlguess_rooms_closed_total', "Rooms closed, by why they were closed.", ['reason'])
@@ -0,0 +1,137 @@
+import re
+import time
+from collections import OrderedDict
+from typing import Callable, Dict
+from eventlet.event import Event
+from app.sql_text import scan
+
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize_query(query : str) -> str:
+    """Normalise query text so that queries that only differ in whitespace, comments or a trailing semicolon match.
+
+    Quoted text, including dollar quoted strings, is kept as it is. Comments are removed rather than collapsed,
+    so a line comment can never swallow the line after it.
+
+    Args:
+        query (str): The query input from the user.
+
+    Returns:
+        str: The normalised query.
+    """
+
+    parts = []
+    # code and comments between two quoted parts, a comment counts as whitespace
+    code = ''
+    for kind, part in scan(query):
+        if kind == 'quoted':
+            parts.append(_WHITESPACE.sub(' ', code))
+            parts.append(part)
+            code = ''
+        else:
+            code += ' ' if kind == 'comment' else part
+
+    parts.append(_WHITESPACE.sub(' ', code))
+    return ''.join(parts).strip().rstrip(';').strip()
+
+def is_cacheable(result : dict) -> bool:
+    """Only successful, complete results are cached. Errors such as timeouts may not happen again and truncated results are read further from a cursor.
+
+    Args:
+        result (dict): The result of a query.
+
+    Returns:
+        bool: If the result can be cached.
+    """
+
+    return 'error' not in result and not result.get('truncated')
+
+class QueryCache():
+    def __init__(self, max_size : int = 256, ttl : float = 30.0, clock : Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+
+        # normalised query -> (expiry time, result), least recently used first
+        self._entries = OrderedDict()
+        # normalised query -> event that is sent the result of the query currently running
+        self._in_flight : Dict[str, Event] = {}
+        # incremented on invalidation so results computed before it are not stored
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get_or_execute(self, query : str, execute : Callable[[], dict], cacheable : Callable[[dict], bool] = is_cacheable) -> dict:
+        """Get the result of a query from the cache, wait for an identical query that is running, or run it.
+
+        Args:
+            query (str): The query input from the user.
+            execute (Callable[[], dict]): Runs the query and returns its result.
+            cacheable (Callable[[dict], bool], optional): If a result can be stored. Defaults to is_cacheable.
+
+        Returns:
+            dict: The result of the query.
+        """
+
+        key = normalize_query(query)
+
+        entry = self._entries.get(key)
+        if entry:
+            if entry[0] > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[1])
+
+            del self._entries[key]
+
+        waiter = self._in_flight.get(key)
+        if waiter:
+            self.coalesced += 1
+            result = waiter.wait()
+
+            # the query raised an exception or its truncated result belongs to another user's cursor, run it here instead
+            if result is not None and not result.get('truncated'):
+                return dict(result)
+
+        self.misses += 1
+        generation = self._generation
+        event = Event()
+        self._in_flight[key] = event
+
+        result = None
+        try:
+            result = execute()
+
+        finally:
+            if self._in_flight.get(key) is event:
+                del self._in_flight[key]
+            event.send(result)
+
+        if self.max_size and generation == self._generation and cacheable(result):
+            self._entries[key] = (self._clock() + self.ttl, result)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        return dict(result)
+
+    def invalidate(self) -> None:
+        """Remove every cached result, used when the data in the game schema changes."""
+
+        self._entries.clear()
+        self._generation += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Get the cache's counters.
+
+        Returns:
+            Dict[str, int]: The hits, misses, coalesced queries and number of cached results.
+        """
+
+        return {
+            'hits' : self.hits,
+            'misses' : self.misses,
+            'coalesced' : self.coalesced,
+            'size' : len(self._entries)
+        }
@@ -0,0 +1,120 @@
+from collections import OrderedDict
+from typing import NamedTuple, Union
+import psycopg2
+from psycopg2.extensions import connection
+from app.query_cache import normalize_query
+from app.result_pages import STREAMABLE_QUERY
+from app.sql_text import split_statements
+
+class CostEstimate(NamedTuple):
+    cost: float
+    rows: float
+    # set when a query with several statements could not be planned
+    error: Union[str, None] = None
+
+class QueryCostLimit():
+    """Rejects queries that the planner estimates to be too expensive before they are run.
+
+    Planning is much cheaper than running a query that would be cancelled by the statement timeout anyway.
+    Estimates are kept for each normalised query, so repeating a rejected query does not reach the database.
+    """
+
+    def __init__(self, max_cost : float = 0, max_rows : float = 0, cache_size : int = 1024):
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+        self.cache_size = cache_size
+
+        # normalised query -> CostEstimate or None when it could not be estimated, least recently used first
+        self._estimates = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_cost or self.max_rows)
+
+    def check(self, conn : connection, query : str) -> Union[str, None]:
+        """Check a query's estimated cost and rows against the limits.
+
+        Args:
+            conn (connection): A readonly connection used to plan the query, its transaction is rolled back by the caller.
+            query (str): The query input from the user.
+
+        Returns:
+            Union[str, None]: The reason the query is rejected or None if it can run.
+        """
+
+        key = normalize_query(query)
+        if key in self._estimates:
+            self._estimates.move_to_end(key)
+            estimate = self._estimates[key]
+
+        else:
+            estimate = self._estimate(conn, query)
+            self._estimates[key] = estimate
+            if len(self._estimates) > self.cache_size:
+                self._estimates.popitem(last=False)
+
+        if estimate is None:
+            return None
+
+        if estimate.error:
+            return f"Query rejected, its statements could not be checked one at a time: {estimate.error}"
+
+        if self.max_cost and estimate.cost > self.max_cost:
+            return f"Query rejected, the planner estimates a cost of {estimate.cost:.0f} which is over the limit of {self.max_cost:.0f}. Narrow it down with conditions or joins on matching columns."
+
+        if self.max_rows and estimate.rows > self.max_rows:
+            return f"Query rejected, the planner estimates {estimate.rows:.0f} rows which is over the limit of {self.max_rows:.0f}. Narrow it down with conditions or joins on matching columns."
+
+        return None
+
+    def invalidate(self) -> None:
+        """Forget every estimate, used when the data in the game schema changes."""
+
+        self._estimates.clear()
+
+    @staticmethod
+    def _estimate(conn : connection, query : str) -> Union[CostEstimate, None]:
+        """Plan every statement of a query without running it.
+
+        Args:
+            conn (connection): A readonly connection.
+            query (str): The query input from the user, comments and line breaks are kept.
+
+        Returns:
+            Union[CostEstimate, None]: The total cost and the most rows of any statement, None if a single statement could not be planned.
+        """
+
+        # each statement is explained on its own so that EXPLAIN never runs the statements after the first
+        statements = split_statements(query)
+
+        cost = 0.0
+        rows = 0.0
+        try:
+            with conn.cursor() as cur:
+                for statement in statements:
+                    if not STREAMABLE_QUERY.match(statement):
+                        # a single statement that cannot be explained is left to the statement timeout
+                        if len(statements) == 1:
+                            return None
+
+                        # otherwise it could be the rest of a split statement that would run unchecked
+                        return CostEstimate(cost, rows, "only queries made of SELECT, WITH, VALUES or TABLE statements can be checked")
+
+                    cur.execute('EXPLAIN (FORMAT JSON) ' + statement)
+                    plan = cur.fetchone()[0][0]['Plan']
+                    cost += plan['Total Cost']
+                    rows = max(rows, plan['Plan Rows'])
+
+        except psycopg2.Error as e:
+            # a single statement fails the same way when it is run, which reports the error to the user
+            if len(statements) <= 1:
+                return None
+
+            # the split may be wrong, so the query is not run unchecked
+            return CostEstimate(cost, rows, str(e).strip())
+
+        except Exception: # pylint: disable=broad-except
+            # a plan in an unexpected shape gives no estimate, the statement timeout still applies
+            return None
+
+        return CostEstimate(cost, rows)
@@ -0,0 +1,151 @@
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Hashable, Union
+from eventlet.event import Event
+from app.metrics import query_queue_wait_seconds, query_queue_rejected
+
+class QueryRejected(Exception):
+    """A query was turned away by the executor before it reached the database."""
+
+    def __init__(self, message : str, reason : str, retry_after : Union[float, None] = None):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class _Waiter():
+    __slots__ = ('event', 'cancelled')
+
+    def __init__(self):
+        self.event = Event()
+        self.cancelled = False
+
+class QueryExecutor():
+    """Runs at most a fixed number of queries at once and queues the rest, taking turns between rooms.
+
+    A query runs in the greenlet that submitted it once it is given a slot, so nothing is handed between threads.
+    Queries are turned away when the queue is full or would not reach the database before their room's round ends.
+    """
+
+    def __init__(self, workers : int = 16, max_queue : int = 200, clock : Callable[[], float] = time.time):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._clock = clock
+
+        self.running = 0
+        self.queued = 0
+        # room -> waiters in arrival order, and the rooms with waiters in the order they are served
+        self._queues : Dict[Hashable, Deque[_Waiter]] = {}
+        self._turns : Deque[Hashable] = deque()
+
+        # moving average of how long a query holds its slot, used to estimate waits
+        self.service_time = 0.05
+
+    def run(self, room : Hashable, deadline : Union[float, None], execute : Callable[[], dict]) -> dict:
+        """Run a query once a slot is free.
+
+        Args:
+            room (Hashable): The room the query is for, rooms take turns.
+            deadline (Union[float, None]): The clock time after which the result is of no use, such as the end of the round.
+            execute (Callable[[], dict]): Runs the query.
+
+        Raises:
+            QueryRejected: The queue is full or the query would not start before the deadline.
+
+        Returns:
+            dict: The result of the query.
+        """
+
+        self._acquire(room, deadline)
+
+        start = time.perf_counter()
+        try:
+            return execute()
+
+        finally:
+            self.service_time += (time.perf_counter() - start - self.service_time) * 0.1
+            self._release()
+
+    def estimated_wait(self, room : Hashable) -> float:
+        """Estimate how long a new query for a room would wait for a slot.
+
+        Args:
+            room (Hashable): The room.
+
+        Returns:
+            float: The estimated seconds.
+        """
+
+        if self.running < self.workers and not self.queued:
+            return 0.0
+
+        # each turn serves one query of every waiting room, so a room's own queue is what it waits behind most
+        own_queue = len(self._queues.get(room, ()))
+        rooms = len(self._turns) + (room not in self._queues)
+        ahead = min(self.queued, (own_queue + 1) * rooms)
+        return (ahead / self.workers + 1) * self.service_time
+
+    def _acquire(self, room : Hashable, deadline : Union[float, None]) -> None:
+        if self.running < self.workers and not self.queued:
+            self.running += 1
+            query_queue_wait_seconds.observe(0)
+            return
+
+        if self.queued >= self.max_queue:
+            query_queue_rejected.labels('queue_full').inc()
+            wait = self.estimated_wait(room)
+            raise QueryRejected(f"The server is busy, try again in {wait:.1f} seconds", 'queue_full', round(wait, 2))
+
+        if deadline is not None and self._clock() + self.estimated_wait(room) > deadline:
+            query_queue_rejected.labels('deadline').inc()
+            raise QueryRejected("The server is too busy to run your query before the round ends", 'deadline')
+
+        waiter = _Waiter()
+        if room not in self._queues:
+            self._queues[room] = deque()
+            self._turns.append(room)
+
+        self._queues[room].append(waiter)
+        self.queued += 1
+
+        start = time.perf_counter()
+        timeout = None if deadline is None else max(0, deadline - self._clock())
+        try:
+            waiter.event.wait(timeout)
+
+        except BaseException:
+            # a greenlet killed while waiting gives back its slot or its place in the queue
+            if waiter.event.ready():
+                self._release()
+            else:
+                waiter.cancelled = True
+                self.queued -= 1
+            raise
+
+        query_queue_wait_seconds.observe(time.perf_counter() - start)
+
+        # given a slot while timing out still counts as given
+        if not waiter.event.ready():
+            waiter.cancelled = True
+            self.queued -= 1
+            query_queue_rejected.labels('timeout').inc()
+            raise QueryRejected("The round ended before your query could run", 'timeout')
+
+    def _release(self) -> None:
+        self.running -= 1
+
+        while self.running < self.workers and self._turns:
+            room = self._turns.popleft()
+            waiters = self._queues[room]
+            waiter = waiters.popleft()
+
+            if waiters:
+                self._turns.append(room)
+            else:
+                del self._queues[room]
+
+            if waiter.cancelled:
+                continue
+
+            self.queued -= 1
+            self.running += 1
+            waiter.event.send()
@@ -0,0 +1,77 @@
+import re
+from typing import NamedTuple, Set, Union
+from app.sql_text import scan, split_statements
+
+# statements that would end or change the transaction the query runs in, or change the pooled session's settings
+REJECTED_STATEMENTS = {'begin', 'start', 'commit', 'end', 'rollback', 'abort', 'savepoint', 'release', 'prepare transaction', 'set', 'reset', 'do', 'call'}
+# functions that change settings, or run SQL given as text that could do the same
+REJECTED_FUNCTIONS = {'set_config', 'query_to_xml', 'query_to_xmlschema', 'query_to_xml_and_xmlschema', 'cursor_to_xml', 'cursor_to_xmlschema', 'ts_stat', 'ts_rewrite'}
+# statements that only read, anything else could leave a prepared statement, cursor or listener in the session
+READ_STATEMENTS = {'select', 'with', 'values', 'table', 'show', 'explain'}
+
+_WORD = re.compile(r'[a-z_][a-z0-9_$]*')
+
+class QueryCheck(NamedTuple):
+    # the error shown to the player if the query is not run
+    rejection: Union[str, None]
+    # the session must be reset before the connection is reused
+    changes_session: bool
+
+def _words(query : str) -> Union[Set[str], None]:
+    """Get every lowercase word in the code and quoted identifiers of a query, where function names are.
+
+    Returns:
+        Union[Set[str], None]: The words, None if an identifier is unicode escaped and could spell any word.
+    """
+
+    words = set()
+    code = ''
+    for kind, part in scan(query):
+        if kind == 'code':
+            code = part
+            words.update(_WORD.findall(part.lower()))
+
+        elif kind == 'quoted' and part.startswith('"'):
+            if code.lower().endswith('u&'):
+                return None
+
+            words.add(part[1:-1].replace('""', '"').lower())
+
+    return words
+
+def check_query(query : str) -> QueryCheck:
+    """Check a query before it runs on an autocommit readonly connection.
+
+    Statements that control the transaction or change settings are turned away, because they would outlive the query on the pooled session.
+    The session is only reset after the statements that could have left something in it.
+
+    Args:
+        query (str): The query input from the user.
+
+    Returns:
+        QueryCheck: Why the query is rejected, None if it can run, and if the session must be reset after it.
+    """
+
+    changes_session = False
+    for statement in split_statements(query):
+        words = _WORD.findall(statement.lstrip('( \t\r\n').lower())
+        keyword = ' '.join(words[:2]) if words[:2] == ['prepare', 'transaction'] else (words[0] if words else '')
+        if keyword in REJECTED_STATEMENTS:
+            return QueryCheck(f"{keyword.upper()} statements are not allowed, every query runs on its own", False)
+
+        if keyword not in READ_STATEMENTS:
+            changes_session = True
+
+    words = _words(query)
+    if words is None:
+        return QueryCheck("Unicode escaped identifiers are not allowed", False)
+
+    rejected = sorted(words & REJECTED_FUNCTIONS)
+    if rejected:
+        return QueryCheck(f"The function {rejected[0]} is not allowed", False)
+
+    # session advisory locks are held until the session is reset
+    if any('advisory' in word for word in words):
+        changes_session = True
+
+    return QueryCheck(None, changes_session)
@@ -0,0 +1,126 @@
+from typing import Union
+
+class TokenBucket():
+    """Allows bursts of up to capacity actions, refilled at rate actions per second.
+
+    The bucket only keeps numbers and is given the time, so it can be stored with the room it belongs to.
+    """
+
+    def __init__(self, rate : float, capacity : float, now : float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def wait_time(self, now : float) -> float:
+        """Check if there is a token without taking it.
+
+        Args:
+            now (float): The current time in seconds.
+
+        Returns:
+            float: 0 if there is a token, otherwise the seconds until there is one.
+        """
+
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            return 0.0
+
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now : float) -> float:
+        """Take a token if there is one.
+
+        Args:
+            now (float): The current time in seconds.
+
+        Returns:
+            float: 0 if a token was taken, otherwise the seconds until there is one.
+        """
+
+        wait = self.wait_time(now)
+        if not wait:
+            self.tokens -= 1
+
+        return wait
+
+    def to_state(self) -> dict:
+        return {'rate' : self.rate, 'capacity' : self.capacity, 'tokens' : self.tokens, 'updated' : self.updated}
+
+    @classmethod
+    def from_state(cls, state : dict) -> 'TokenBucket':
+        bucket = cls(float(state['rate']), float(state['capacity']), float(state['updated']))
+        bucket.tokens = float(state['tokens'])
+        return bucket
+
+class QueryLimits():
+    """The rate and database time limits of a user or a room. A rate or budget of 0 turns that limit off."""
+
+    def __init__(self, rate : float, burst : float, db_time_budget : float, now : float):
+        self.bucket = TokenBucket(rate, max(1, burst), now) if rate > 0 else None
+        self.db_time_budget = db_time_budget
+        # seconds spent on this user's or room's queries in the current round
+        self.db_time = 0.0
+
+    def to_state(self) -> dict:
+        """Get the limits as JSON serialisable values, to store them with their room.
+
+        Returns:
+            dict: The state.
+        """
+
+        return {
+            'bucket' : self.bucket.to_state() if self.bucket is not None else None,
+            'db_time_budget' : self.db_time_budget,
+            'db_time' : self.db_time
+            }
+
+    @classmethod
+    def from_state(cls, state : dict) -> 'QueryLimits':
+        """Restore limits from their stored state.
+
+        Args:
+            state (dict): The state from to_state.
+
+        Returns:
+            QueryLimits: The limits.
+        """
+
+        limits = cls(0, 0, float(state['db_time_budget']), 0)
+        if state['bucket'] is not None:
+            limits.bucket = TokenBucket.from_state(state['bucket'])
+
+        limits.db_time = float(state['db_time'])
+        return limits
+
+    def check(self, now : float) -> Union[float, None]:
+        """Check if a query can run now without using up a token, so a query turned away by another limit costs nothing.
+
+        Args:
+            now (float): The current time in seconds.
+
+        Returns:
+            Union[float, None]: None if the query can run, the seconds to wait if it is over the rate or -1 if the round's database time is used up.
+        """
+
+        if self.db_time >= self.db_time_budget > 0:
+            return -1
+
+        if self.bucket is not None:
+            wait = self.bucket.wait_time(now)
+            if wait > 0:
+                return wait
+
+        return None
+
+    def admit(self, now : float) -> None:
+        """Use up a token for a query that passed every check.
+
+        Args:
+            now (float): The current time in seconds.
+        """
+
+        if self.bucket is not None:
+            self.bucket.take(now)
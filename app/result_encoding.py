@@ -0,0 +1,123 @@
+import json
+import math
+import zlib
+import uuid
+import datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Union
+
+def _encode_float(value : float) -> Any:
+    # NaN and infinity are valid in postgres but not in JSON
+    return value if math.isfinite(value) else str(value)
+
+def _encode_decimal(value : Decimal) -> Any:
+    # numeric values are sent as text so no precision is lost
+    return str(value)
+
+def _encode_bytes(value : bytes) -> str:
+    return '\\x' + bytes(value).hex()
+
+# types that JSON cannot represent, by how they are shown to the player
+_CONVERTERS : Dict[type, Callable[[Any], Any]] = {
+    float : _encode_float,
+    Decimal : _encode_decimal,
+    datetime.date : datetime.date.isoformat,
+    datetime.datetime : datetime.datetime.isoformat,
+    datetime.time : datetime.time.isoformat,
+    datetime.timedelta : str,
+    uuid.UUID : str,
+    bytes : _encode_bytes,
+    memoryview : _encode_bytes,
+    }
+
+_JSON_TYPES = (str, int, bool, type(None))
+
+def result_row_count(returning : dict) -> Union[int, None]:
+    """Count the rows of an encoded page of results.
+
+    Args:
+        returning (dict): The page.
+
+    Returns:
+        Union[int, None]: The number of rows or None if the page is an error.
+    """
+
+    if 'result' in returning:
+        return len(returning['result'])
+
+    return returning.get('row_count')
+
+def to_json_value(value : Any) -> Any:
+    """Convert a value read from the database to one that JSON can represent.
+
+    Args:
+        value (Any): The value.
+
+    Returns:
+        Any: The value, or its text for types such as Decimal and dates.
+    """
+
+    if isinstance(value, _JSON_TYPES):
+        return value
+
+    converter = _CONVERTERS.get(type(value))
+    if converter:
+        return converter(value)
+
+    if isinstance(value, (list, tuple)):
+        return [to_json_value(item) for item in value]
+
+    if isinstance(value, dict):
+        return {str(key) : to_json_value(item) for key, item in value.items()}
+
+    return str(value)
+
+class ResultEncoder():
+    """Encodes the rows of query results before they are sent to the player.
+
+    'rows' keeps the list of row tuples. 'columns' sends one array per column so the structure is not repeated for every row,
+    and once that is over the compression threshold it is sent as deflated JSON bytes instead.
+    """
+
+    def __init__(self, mode : str = 'rows', compress_threshold : int = 8192, compress_level : int = 6):
+        if mode not in ('rows', 'columns'):
+            raise ValueError(f"Unknown result encoding {mode}")
+
+        self.mode = mode
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+
+    def encode(self, returning : dict) -> dict:
+        """Encode a page of results in place. Errors are left as they are.
+
+        Args:
+            returning (dict): A page of results with 'result' and 'columns'.
+
+        Returns:
+            dict: The same page with its rows encoded.
+        """
+
+        if 'result' not in returning:
+            return returning
+
+        rows : List[tuple] = returning['result']
+
+        if self.mode == 'rows':
+            returning['result'] = [[to_json_value(value) for value in row] for row in rows]
+            return returning
+
+        values = [[to_json_value(value) for value in column] for column in zip(*rows)]
+        body = {'columns' : returning.pop('columns'), 'values' : values, 'row_count' : len(rows)}
+        del returning['result']
+
+        if self.compress_threshold:
+            data = json.dumps(body, separators=(',', ':')).encode()
+            if len(data) > self.compress_threshold:
+                returning['encoding'] = 'columns+deflate'
+                returning['data'] = zlib.compress(data, self.compress_level)
+                returning['row_count'] = len(rows)
+                return returning
+
+        returning['encoding'] = 'columns'
+        returning.update(body)
+        return returning
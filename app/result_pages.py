@@ -0,0 +1,137 @@
+import re
+import uuid
+from typing import Iterator, List, Tuple, Union
+from psycopg2.extensions import connection, cursor
+from app.scheduler import ScheduledCall
+from app.sql_text import split_statements
+
+# statements that can be declared as a server-side cursor
+STREAMABLE_QUERY = re.compile(r'^[\s(]*(select|with|values|table)\b', re.IGNORECASE)
+
+def streamable_statement(query : str) -> Union[str, None]:
+    """Get the statement to declare as a server-side cursor.
+
+    Args:
+        query (str): The query input from the user.
+
+    Returns:
+        Union[str, None]: The query's only statement without comments, None if it has several statements or one that cannot be declared.
+    """
+
+    # a cursor is declared for one statement, the results of the others would be read as if they were its rows
+    statements = split_statements(query)
+    if len(statements) != 1 or not STREAMABLE_QUERY.match(statements[0]):
+        return None
+
+    return statements[0]
+
+def estimate_row_size(row : tuple) -> int:
+    """Estimate how many bytes a row takes up once it is sent to the client.
+
+    Args:
+        row (tuple): The row.
+
+    Returns:
+        int: The estimated size of the row.
+    """
+
+    return len(str(row))
+
+def fetch_page(cur : cursor, next_row : Union[tuple, None], max_rows : int, max_bytes : int) -> Tuple[List[tuple], Union[tuple, None]]:
+    """Read rows from a cursor until it is exhausted or a budget is reached.
+
+    Args:
+        cur (cursor): The cursor to read from.
+        next_row (Union[tuple, None]): A row that was read ahead by the previous page, if any.
+        max_rows (int): The maximum number of rows in the page.
+        max_bytes (int): The maximum estimated size of the page. The page always has at least one row.
+
+    Returns:
+        Tuple[List[tuple], Union[tuple, None]]: The rows of the page and the first row of the next page, None if there are no more rows.
+    """
+
+    rows = []
+    size = 0
+
+    if next_row is None:
+        next_row = next(cur, None)
+
+    while next_row is not None:
+        row_size = estimate_row_size(next_row)
+        if len(rows) >= max_rows or (rows and size + row_size > max_bytes):
+            break
+
+        rows.append(next_row)
+        size += row_size
+        next_row = next(cur, None)
+
+    return rows, next_row
+
+class ServerCursor():
+    """Reads the rows of a statement from a cursor declared on the server, a batch at a time.
+
+    On an autocommit connection, the transaction the cursor needs, the cursor and its first batch are asked for in one message
+    instead of the separate BEGIN and DECLARE a psycopg2 named cursor sends. The transaction stays open for the later batches
+    and is rolled back when the connection is returned to the pool.
+    """
+
+    def __init__(self, cur : cursor, itersize : int):
+        self._cursor = cur
+        self._name = f'query_{uuid.uuid4().hex}'
+        self.itersize = itersize
+        self._rows : Iterator[tuple] = iter(())
+        self._exhausted = False
+
+    @property
+    def description(self) -> tuple:
+        return self._cursor.description
+
+    def execute(self, statement : str) -> None:
+        """Declare the cursor for a statement and read the first batch.
+
+        Args:
+            statement (str): A single statement without a trailing semicolon.
+        """
+
+        self._cursor.execute(f'BEGIN; DECLARE {self._name} NO SCROLL CURSOR FOR {statement}; FETCH FORWARD {self.itersize} FROM {self._name}')
+        self._read_batch()
+
+    def close(self) -> None:
+        self._cursor.close()
+
+    def __iter__(self) -> 'ServerCursor':
+        return self
+
+    def __next__(self) -> tuple:
+        row = next(self._rows, None)
+        if row is None and not self._exhausted:
+            self._cursor.execute(f'FETCH FORWARD {self.itersize} FROM {self._name}')
+            self._read_batch()
+            row = next(self._rows, None)
+
+        if row is None:
+            raise StopIteration
+
+        return row
+
+    def _read_batch(self) -> None:
+        rows = self._cursor.fetchall()
+        # a short batch is the end of the result, so no more batches are asked for
+        self._exhausted = len(rows) < self.itersize
+        self._rows = iter(rows)
+
+class HeldCursor():
+    def __init__(self, conn : connection, cur : Union[cursor, ServerCursor, None], columns : Union[List[str], None], next_row : Union[tuple, None],
+                 reset_session : bool = False):
+        self.conn = conn
+        self.cursor = cur
+        self.columns = columns
+        self.next_row = next_row
+        # the query could have changed the session, which is reset when the connection is returned
+        self.reset_session = reset_session
+        self.offset = 0
+        self.expiry : Union[ScheduledCall, None] = None
+        # a page is being read, the cursor cannot be closed until the read ends
+        self.reading = False
+        # released while a page was being read, the read closes the cursor when it ends
+        self.released = False
@@ -23,7 +23,12 @@ def create():
     if request.method == 'POST' and form.validate():
 
         created_room = room_manager.host_room()
+        if not created_room:
+            form.display_name.errors.append("There are no rooms available, try again later")
+            return render_template('create_room.html', form=form)
+
         user_id = created_room.set_host(form.display_name.data)
+        room_manager.save_room(created_room)
 
         session['_id'] = user_id
         session['room_code'] = created_room.room_code
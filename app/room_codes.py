@@ -0,0 +1,118 @@
+import string
+import secrets
+from collections import deque
+from typing import Union, Dict
+
+CODE_LENGTH = 4
+CODE_ALPHABET = string.ascii_lowercase
+CODE_SPACE = len(CODE_ALPHABET) ** CODE_LENGTH
+
+def encode_room_code(room_id : int) -> str:
+    """Convert a room id into its four letter room code.
+
+    Args:
+        room_id (int): The id of the room, between 0 and CODE_SPACE - 1.
+
+    Returns:
+        str: The lowercase room code.
+    """
+
+    letters = []
+    for _ in range(CODE_LENGTH):
+        room_id, remainder = divmod(room_id, len(CODE_ALPHABET))
+        letters.append(CODE_ALPHABET[remainder])
+
+    return ''.join(reversed(letters))
+
+class RoomCodeAllocator():
+    def __init__(self, randomize : bool = False, capacity : int = CODE_SPACE):
+        self.randomize = randomize
+        self.capacity = capacity
+        self._in_use = 0
+
+        # sequential allocation: hand out released ids first, then the next unused id
+        self._released_ids = deque()
+        self._next_id = 0
+
+        # random allocation: a lazily materialised Fisher-Yates shuffle of the id space
+        # ids in positions [0, _remaining) are free, only swapped positions are stored
+        self._swapped_ids : Dict[int, int] = {}
+        self._remaining = capacity
+
+    def allocate(self) -> Union[int, None]:
+        """Take a free room id.
+
+        Returns:
+            Union[int, None]: The room id or None if every code is in use.
+        """
+
+        if self.randomize:
+            room_id = self._allocate_random()
+        else:
+            room_id = self._allocate_sequential()
+
+        if room_id is not None:
+            self._in_use += 1
+
+        return room_id
+
+    def release(self, room_id : int) -> None:
+        """Return a room id so that it can be handed out again.
+
+        Args:
+            room_id (int): The room id to free.
+        """
+
+        if self.randomize:
+            self._swapped_ids[self._remaining] = room_id
+            self._remaining += 1
+        else:
+            self._released_ids.append(room_id)
+
+        self._in_use -= 1
+
+    def stats(self) -> Dict[str, float]:
+        """Get the occupancy of the code space.
+
+        Returns:
+            Dict[str, float]: The capacity, the number of codes in use and available, and the fraction in use.
+        """
+
+        return {
+            'capacity' : self.capacity,
+            'in_use' : self._in_use,
+            'available' : self.capacity - self._in_use,
+            'occupancy' : self._in_use / self.capacity
+        }
+
+    def _allocate_sequential(self) -> Union[int, None]:
+        """Take the oldest released id or the next unused one."""
+
+        if self._released_ids:
+            return self._released_ids.popleft()
+
+        if self._next_id >= self.capacity:
+            return None
+
+        room_id = self._next_id
+        self._next_id += 1
+        return room_id
+
+    def _allocate_random(self) -> Union[int, None]:
+        """Take a uniformly random free id."""
+
+        if not self._remaining:
+            return None
+
+        index = secrets.randbelow(self._remaining)
+        last = self._remaining - 1
+
+        room_id = self._swapped_ids.get(index, index)
+
+        # move the last free id into the taken position
+        self._swapped_ids[index] = self._swapped_ids.pop(last, last)
+        if index == last:
+            del self._swapped_ids[index]
+
+        self._remaining -= 1
+        return room_id
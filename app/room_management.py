@@ -1,15 +1,49 @@
-import string
+import os
 import uuid
-import time
+import math
 import random
-import json
-from typing import Union, List, Dict, Tuple
-from eventlet import spawn_after
+from collections import deque
+from functools import partial
+from contextlib import contextmanager
+from typing import Union, List, Dict, Tuple, Callable, Iterator, Any, NamedTuple
 from flask_socketio import SocketIO
 from app import game_database
+from app.broadcast import broadcaster
+from app.catalog import CatalogLocation
+from app.metrics import registry, hint_lateness_seconds, rooms_closed, reaped_users, queries_limited
+from app.rate_limit import QueryLimits
+from app.room_codes import encode_room_code
+from app.room_store import RoomStore, create_room_store
+from app.scoreboard import Scoreboard
+from app.scheduler import scheduler
 
 socketio = None
 
+CHANGE_LOG_SIZE = int(os.environ.get('ROOM_CHANGE_LOG_SIZE', 64))
+ROOM_STATUSES = {0 : 'waiting', 1 : 'in_round', 2 : 'between_rounds'}
+USER_STATUSES = {0 : 'disconnected', 1 : 'connected', 2 : 'connecting'}
+SCOREBOARD_PUSH_INTERVAL = float(os.environ.get('SCOREBOARD_PUSH_INTERVAL', 2))
+ROUND_LENGTH = int(os.environ.get('ROUND_LENGTH', 80))
+
+# seconds between sweeps for users who left and rooms nobody is in
+REAPER_INTERVAL = float(os.environ.get('REAPER_INTERVAL', 30))
+USER_DISCONNECT_TTL = float(os.environ.get('USER_DISCONNECT_TTL', 120))
+ROOM_IDLE_TTL = float(os.environ.get('ROOM_IDLE_TTL', 600))
+# with a shared room store one worker sweeps each interval, the lease runs out before the worker that took it sweeps again
+REAPER_LEASE = REAPER_INTERVAL * 0.8
+
+# queries per second with bursts of up to the burst size, and seconds of database time per round, 0 turns a limit off
+USER_QUERY_RATE = float(os.environ.get('USER_QUERY_RATE', 1))
+USER_QUERY_BURST = float(os.environ.get('USER_QUERY_BURST', 5))
+USER_DB_TIME_BUDGET = float(os.environ.get('USER_DB_TIME_BUDGET', 10))
+ROOM_QUERY_RATE = float(os.environ.get('ROOM_QUERY_RATE', 4))
+ROOM_QUERY_BURST = float(os.environ.get('ROOM_QUERY_BURST', 20))
+ROOM_DB_TIME_BUDGET = float(os.environ.get('ROOM_DB_TIME_BUDGET', 60))
+
+class ReapReport(NamedTuple):
+    users: int
+    rooms: int
+
 class User():
     def __init__(self, display_name : str):
         self.display_name = display_name
@@ -18,12 +52,69 @@ class User():
         self.connections = 0
         self.query_count = 0
         self.guessed_correctly = False
+        # the scheduler clock time of the user's correct guess this round
+        self.guessed_at = None
+        # when the user last disconnected, or joined if they never connected
+        self.last_seen = scheduler.clock()
+        self.query_limits = QueryLimits(USER_QUERY_RATE, USER_QUERY_BURST, USER_DB_TIME_BUDGET, self.last_seen)
+
+    def to_state(self) -> dict:
+        """Get the user as JSON serialisable values, to store them with their room.
+
+        Returns:
+            dict: The state.
+        """
+
+        return {
+            'display_name' : self.display_name,
+            'conn_id' : str(self.conn_id),
+            'status' : self.status,
+            'connections' : self.connections,
+            'query_count' : self.query_count,
+            'guessed_correctly' : self.guessed_correctly,
+            'guessed_at' : self.guessed_at,
+            'last_seen' : self.last_seen,
+            'query_limits' : self.query_limits.to_state()
+            }
+
+    @classmethod
+    def from_state(cls, state : dict) -> 'User':
+        """Restore a user from their stored state.
+
+        Args:
+            state (dict): The state from to_state.
+
+        Returns:
+            User: The user.
+        """
+
+        user = cls(str(state['display_name']))
+        user.conn_id = uuid.UUID(state['conn_id'])
+        user.status = int(state['status'])
+        user.connections = int(state['connections'])
+        user.query_count = int(state['query_count'])
+        user.guessed_correctly = bool(state['guessed_correctly'])
+        user.guessed_at = state['guessed_at']
+        user.last_seen = float(state['last_seen'])
+        user.query_limits = QueryLimits.from_state(state['query_limits'])
+        return user
 
 class Host(User):
     def __init__(self, display_name : str):
         super().__init__(display_name)
         self.sid = None
 
+    def to_state(self) -> dict:
+        state = super().to_state()
+        state['sid'] = self.sid
+        return state
+
+    @classmethod
+    def from_state(cls, state : dict) -> 'Host':
+        host = super().from_state(state)
+        host.sid = state['sid']
+        return host
+
     def set_sid(self, sid : str):
         """Set the sid of the host's connection.
 
@@ -36,97 +127,312 @@ class Host(User):
 class Room():
     def __init__(self, room_id : int):
         self.room_id = room_id
-
-        # generate alphabetical code from id int
-        full_ids, remainder = divmod(room_id, 26)
-        room_code = 'z' * full_ids + string.ascii_lowercase[remainder]
-        self.room_code = room_code.ljust(4, 'a')
+        self.room_code = encode_room_code(room_id)
+        # tells this room apart from later rooms that reuse its code
+        self.instance_id = uuid.uuid4()
 
         self.users = []
         self.host = None
+        self.scoreboard = Scoreboard()
+        self._scoreboard_push_pending = False
 
         self.location = None
         self.available_hints = None
         self.answer = None
+        self._location_deck = game_database.catalog.deck()
         self._generate_answer_and_hints()
         self.given_hints = []
 
         self.is_closed = False
         self.host_left = False
 
-        self.start_time = 80
-        self.current_time = self.start_time
+        self.start_time = ROUND_LENGTH
+        self.round_deadline = None
+        self.round_started_at = None
+        self.round_number = 0
         self.status = 0 # 0 = waiting for users to connect, 1 = game started and in round, 2 = in-between rounds
 
+        # every event sent to the room is a change to its state, recent changes are kept for reconnecting users
+        self.version = 0
+        self._changes = deque(maxlen=CHANGE_LOG_SIZE)
+        self.last_active = scheduler.clock()
+        self.query_limits = QueryLimits(ROOM_QUERY_RATE, ROOM_QUERY_BURST, ROOM_DB_TIME_BUDGET, self.last_active)
+
+    @property
+    def current_time(self) -> int:
+        """The number of seconds left in the round, derived from the round's deadline."""
+
+        if self.round_deadline is None:
+            return self.start_time
+
+        return max(0, math.ceil(self.round_deadline - scheduler.clock()))
+
+    def to_state(self) -> dict:
+        """Get the room as JSON serialisable values, for the shared room store. No code is run to read it back.
+
+        Returns:
+            dict: The state.
+        """
+
+        return {
+            'room_id' : self.room_id,
+            'instance_id' : str(self.instance_id),
+            'users' : [user.to_state() for user in self.users],
+            # the host is also one of the users unless they were removed
+            'host' : self.host.to_state() if self.host else None,
+            'scoreboard_push_pending' : self._scoreboard_push_pending,
+            'location' : list(self.location) if self.location else None,
+            'available_hints' : self.available_hints,
+            'answer' : self.answer,
+            # the deck is stored as the order of the locations left in it
+            'location_deck' : self._location_deck.remaining(),
+            'given_hints' : self.given_hints,
+            'is_closed' : self.is_closed,
+            'host_left' : self.host_left,
+            'start_time' : self.start_time,
+            'round_deadline' : self.round_deadline,
+            'round_started_at' : self.round_started_at,
+            'round_number' : self.round_number,
+            'status' : self.status,
+            'version' : self.version,
+            'changes' : list(self._changes),
+            'last_active' : self.last_active,
+            'query_limits' : self.query_limits.to_state()
+            }
+
+    @classmethod
+    def from_state(cls, state : dict) -> 'Room':
+        """Restore a room from its stored state.
+
+        Args:
+            state (dict): The state from to_state.
+
+        Returns:
+            Room: The room.
+        """
+
+        room = cls.__new__(cls)
+        room.room_id = int(state['room_id'])
+        room.room_code = encode_room_code(room.room_id)
+        room.instance_id = uuid.UUID(state['instance_id'])
+
+        host = Host.from_state(state['host']) if state['host'] else None
+        room.users = []
+        room.scoreboard = Scoreboard()
+        for user_state in state['users']:
+            user = host if host and user_state['conn_id'] == str(host.conn_id) else User.from_state(user_state)
+            room.users.append(user)
+            # users are added in the order they joined, which breaks ties in the ranking
+            room.scoreboard.add(user)
+
+        room.host = host
+        room._scoreboard_push_pending = bool(state['scoreboard_push_pending'])
+
+        location = state['location']
+        room.location = CatalogLocation(location[0], location[1], location[2], location[3], tuple(location[4])) if location else None
+        room.available_hints = [tuple(hint) for hint in state['available_hints']] if state['available_hints'] is not None else None
+        room.answer = state['answer']
+        room._location_deck = game_database.catalog.deck(state['location_deck'])
+        room.given_hints = [tuple(hint) for hint in state['given_hints']]
+
+        room.is_closed = bool(state['is_closed'])
+        room.host_left = bool(state['host_left'])
+
+        room.start_time = state['start_time']
+        room.round_deadline = state['round_deadline']
+        room.round_started_at = state['round_started_at']
+        room.round_number = int(state['round_number'])
+        room.status = int(state['status'])
+
+        room.version = int(state['version'])
+        room._changes = deque(state['changes'], maxlen=CHANGE_LOG_SIZE)
+        room.last_active = float(state['last_active'])
+        room.query_limits = QueryLimits.from_state(state['query_limits'])
+        return room
+
     def start(self) -> None:
-        """Start the room's schedule timer."""
+        """Start the round and schedule its hints and end."""
         self.status = 1
-        socketio.start_background_task(target=self.manage_time)
 
-    def manage_time(self) -> None:
-        """Manage the room's event schedule."""
-        self._send_hint()
+        # database time budgets are per round
+        self.query_limits.db_time = 0.0
+        for user in self.users:
+            user.query_limits.db_time = 0.0
+
+        round_start = scheduler.clock()
+        self.round_deadline = round_start + self.start_time
+        self.round_started_at = round_start
+        self.round_number += 1
 
         hints_count = 4
-        time_per_loop = self.start_time / hints_count
+        time_per_hint = self.start_time / hints_count
 
+        # the first hint is sent on the scheduler's next tick, the last interval ends the round
         for hint_round in range(hints_count):
-            i = 0
-            while i < time_per_loop:
-                time.sleep(1)
-                self.current_time -= 1
-                i += 1
-
-            if not hint_round == hints_count - 1:
-                self._send_hint()
-        
-         # Check if the room was closed
+            hint_time = round_start + hint_round * time_per_hint
+            room_manager.call_at(hint_time, self, partial(Room._send_hint, scheduled_for=hint_time))
+
+        room_manager.call_at(self.round_deadline, self, Room._end_round)
+
+    def _end_round(self) -> None:
+        """End the round and send the results to the room."""
+
+        # results of the round's queries cannot be paged through anymore
+        game_database.release_cursors(user.conn_id for user in self.users)
+
+        # the results are written in the background, before the next round resets them
+        game_database.round_history.record_round(self)
+
+        # Check if the room was closed
         if self.is_closed:
             self.status = 2
             room_manager.close_room(self)
             return
 
         self.status = 2
-        socketio.emit('end_round', json.dumps({'user_query_counts' : self.get_user_query_counts(), 'correct_location' : self.location.name}), room=self.room_code)
+        self.broadcast('end_round', {'user_query_counts' : self.get_user_query_counts(), 'correct_location' : self.location.name})
         self.given_hints = []
 
     def next_round(self) -> None:
         """Reset room for the next round."""
-        self.reset_query_counts()
+        self._reset_query_counts()
         self._generate_answer_and_hints()
 
-        self.current_time = self.start_time
         self.start()
-        socketio.emit('begin_round', room=self.room_code)
+        self.broadcast('begin_round')
+
+    def broadcast(self, event : str, payload : Any = None, skip_sid : Union[str, None] = None) -> None:
+        """Record a change to the room's state and send it to the users in the room.
+
+        Args:
+            event (str): The name of the event.
+            payload (Any, optional): The data of the event. Defaults to None.
+            skip_sid (Union[str, None], optional): The sid of a user that should ignore the event. Defaults to None.
+        """
 
-    def get_user_query_counts(self) -> List[Tuple[str, str]]:
-        """Get a list of users and their respective query counts.
+        self.version += 1
+        self.last_active = scheduler.clock()
+        self._changes.append([event, payload, skip_sid, self.version])
+        broadcaster.emit(self.room_code, event, payload, skip_sid, self.version)
+
+    def get_changes_since(self, version : int) -> Union[List[list], None]:
+        """Get the changes a user missed since they last saw the room's state.
+
+        Args:
+            version (int): The last version of the room's state the user saw.
 
         Returns:
-            List[Tuple[str, str]]: The first string in the tuple is the display_name and the second is the query_count.
+            Union[List[list], None]: The changes in order, None if they are no longer kept and the user needs the full state.
         """
 
-        successful_users = []
-        unsuccessful_users = []
-        for user in self.users:
-            if user.guessed_correctly:
-                successful_users.append(user)
-            
-            else:
-                unsuccessful_users.append(user)
+        if version > self.version:
+            return None
 
-        sorted_users = sorted(successful_users, key=lambda user: user.query_count)
-        sorted_unsuccessful_users = sorted(unsuccessful_users, key=lambda user: user.query_count)
-        sorted_users.extend(sorted_unsuccessful_users)
+        if version < self.version and (not self._changes or self._changes[0][3] > version + 1):
+            return None
+
+        return [change for change in self._changes if change[3] > version]
+
+    def get_user_query_counts(self) -> List[Tuple[str, int, bool]]:
+        """Get a list of users and their respective query counts, in rank order.
+
+        Returns:
+            List[Tuple[str, int, bool]]: The display_name, the query_count and if the user guessed correctly.
+        """
 
-        return [(user.display_name, user.query_count, user.guessed_correctly) for user in sorted_users]
+        return self.scoreboard.standings()
 
-    def reset_query_counts(self) -> None:
+    def _reset_query_counts(self) -> None:
         """Set the query count of all users to 0."""
 
         for user in self.users:
             user.query_count = 0
             user.guessed_correctly = False
+            user.guessed_at = None
+
+        self.scoreboard.reset()
+
+    def admit_query(self, user : User) -> Union[dict, None]:
+        """Check a user's and the room's query limits before a query runs. One busy room cannot use up every connection.
+
+        Args:
+            user (User): The user that wants to run a query.
+
+        Returns:
+            Union[dict, None]: None if the query can run, otherwise the response telling the user to slow down.
+        """
+
+        now = scheduler.clock()
+
+        # the user's own limits come first and tokens are only taken once both pass, so one player over their limit cannot use up the room's
+        for limit, limits, owner in (('user', user.query_limits, "your"), ('room', self.query_limits, "this room's")):
+            wait = limits.check(now)
+            if wait is None:
+                continue
+
+            if wait < 0:
+                queries_limited.labels(f'{limit}_db_time').inc()
+                return {
+                    'error' : f"Slow down, {owner} queries have used up their database time for this round",
+                    'rate_limited' : True,
+                    'limit' : f'{limit}_db_time',
+                    'retry_after' : None
+                    }
+
+            queries_limited.labels(limit).inc()
+            return {
+                'error' : f"Slow down, {owner} queries are over the limit, try again in {wait:.1f} seconds",
+                'rate_limited' : True,
+                'limit' : limit,
+                'retry_after' : round(wait, 2)
+                }
+
+        user.query_limits.admit(now)
+        self.query_limits.admit(now)
+        return None
+
+    def record_query(self, user : User, db_time : float = 0.0, count : bool = True) -> None:
+        """Count a query made by a user and add the time it took to the round's database time.
+
+        Args:
+            user (User): The user that made the query.
+            db_time (float, optional): The seconds the query took. Defaults to 0.0.
+            count (bool, optional): If the query counts towards the user's score, pages of its results only use database time. Defaults to True.
+        """
+
+        user.query_limits.db_time += db_time
+        self.query_limits.db_time += db_time
+
+        if count:
+            user.query_count += 1
+            self._update_score(user)
+
+    def _update_score(self, user : User) -> None:
+        """Re-rank a user and schedule sending the live scoreboard to the room.
+
+        Args:
+            user (User): The user whose score changed.
+        """
+
+        if not self.scoreboard.update(user) or self._scoreboard_push_pending:
+            return
+
+        # changes are sent together at most once per interval
+        # the flag is stored with the room but the timer that clears it is only in this worker's scheduler
+        self._scoreboard_push_pending = True
+        room_manager.call_at(scheduler.clock() + SCOREBOARD_PUSH_INTERVAL, self, Room._push_scoreboard)
+
+    def _push_scoreboard(self) -> None:
+        """Send the live scoreboard to the users in the room."""
+
+        self._scoreboard_push_pending = False
+
+        # the final standings are sent with the end of the round
+        if self.status != 1:
+            return
+
+        # not recorded as a change, the next push or the end of the round replaces it
+        broadcaster.emit(self.room_code, 'scoreboard', self.scoreboard.standings())
 
     def set_host(self, display_name : str) -> uuid.UUID:
         """Set the host of the room.
@@ -142,6 +448,7 @@ class Room():
         host = Host(display_name)
         self.host = host
         self.users.append(host)
+        self.scoreboard.add(host)
         return host.conn_id
 
     def is_host(self, user_conn_id : uuid.UUID) -> bool:
@@ -168,6 +475,7 @@ class Room():
 
         user = User(display_name)
         self.users.append(user)
+        self.scoreboard.add(user)
         return user.conn_id
 
     def remove_user(self, user_conn_id : uuid.UUID) -> None:
@@ -180,6 +488,7 @@ class Room():
         for user in self.users:
             if user.conn_id == user_conn_id:
                 self.users.pop(i)
+                self.scoreboard.remove(user)
                 break
 
             i += 1
@@ -225,6 +534,7 @@ class Room():
 
         user = self.get_user(user_conn_id)
         user.status = 0
+        user.last_seen = scheduler.clock()
 
         # close room if host disconnects
         if self.is_host(user.conn_id):
@@ -280,42 +590,58 @@ class Room():
         """
 
         answer_correct = self.answer == guess.lower()
+        if not answer_correct:
+            user.guessed_at = None
+        elif not user.guessed_correctly:
+            user.guessed_at = scheduler.clock()
+
         user.guessed_correctly = answer_correct
+        self._update_score(user)
         return answer_correct
 
     def _generate_answer_and_hints(self) -> None:
         """Create the answer and hints for this room."""
 
-        self.location, self.available_hints = game_database.get_random_location()
+        self.location = self._location_deck.draw()
+        self.available_hints = self.location.hints()
         random.shuffle(self.available_hints)
         self.answer = self.location.name.lower()
 
-    def _send_hint(self) -> None:
-        """Send a hint to the users in the room."""
+    def _send_hint(self, scheduled_for : Union[float, None] = None) -> None:
+        """Send a hint to the users in the room.
+
+        Args:
+            scheduled_for (Union[float, None], optional): The scheduler clock time the hint was due, to measure how late it is. Defaults to None.
+        """
+
+        if scheduled_for is not None:
+            hint_lateness_seconds.observe(max(0, scheduler.clock() - scheduled_for))
 
         hint = self.available_hints.pop(random.randrange(len(self.available_hints)))
         self.given_hints.append(hint)
-        socketio.emit('hint', {'name': hint[0], 'value': hint[1]}, room=self.room_code)
+        self.broadcast('hint', {'name': hint[0], 'value': hint[1]})
 
 class RoomManager():
-    def __init__(self):
-        self._active_rooms = []
-        self._open_room_ids = []
-        self._next_room_id = 0
+    def __init__(self, store : Union[RoomStore, None] = None):
+        # rooms are kept in this process unless a shared store is configured for several workers
+        if store is None:
+            store = create_room_store(os.environ.get('ROOM_STORE_URL'), Room.from_state, randomize=os.environ.get('RANDOM_ROOM_CODES', 'false').lower() == 'true')
+
+        self._store = store
 
-    def host_room(self) -> Room:
-        """Get an open room or create one.
+    def host_room(self) -> Union[Room, None]:
+        """Create a room with a free room code.
 
         Returns:
-            Room: The open or new room.
+            Union[Room, None]: The new room or None if every room code is in use.
         """
 
-        if self._open_room_ids:
-            room = Room(self._open_room_ids.pop(0))
-        else:
-            room = self._create_room()
+        room_id = self._store.allocate_room_id()
+        if room_id is None:
+            return None
 
-        self._active_rooms.append(room)
+        room = Room(room_id)
+        self._store.add(room)
         return room
 
     def add_user_to_room(self, room_code : str, display_name : str) -> Union[uuid.UUID, None]:
@@ -329,14 +655,15 @@ class RoomManager():
             Union[uuid.UUID, None]: The UUID of the new user or None if the room does not exist.
         """
 
-        room = self.get_room(room_code.lower())
-        if not room or room.is_closed or room.host_left:
-            return None
+        with self.edit_room(room_code) as room:
+            if not room or room.is_closed or room.host_left:
+                return None
 
-        return room.add_user(display_name)
+            return room.add_user(display_name)
 
     def get_room(self, room_code : str) -> Union[Room, None]:
         """Searches for the room that room_code is associated with and returns the room or None.
+        Changes to the room must be saved with save_room, or made inside edit_room.
 
         Args:
             room_code (str): The 4 letter code that users use to join the room.
@@ -345,7 +672,68 @@ class RoomManager():
             Union[Room, None]: Room if the room with room_code is found, None if there is no room with room_code.
         """
 
-        return next(filter(lambda room : room.room_code == room_code.lower(), self._active_rooms), None)
+        if not room_code:
+            return None
+
+        return self._store.get(room_code.lower())
+
+    def save_room(self, room : Room) -> None:
+        """Write back changes made to a room.
+
+        Args:
+            room (Room): The changed room.
+        """
+
+        self._store.save(room)
+
+    @contextmanager
+    def edit_room(self, room_code : str) -> Iterator[Union[Room, None]]:
+        """Get a room to change. No other worker can change the room until the block ends, then the room is saved.
+
+        Args:
+            room_code (str): The 4 letter code that users use to join the room.
+
+        Yields:
+            Iterator[Union[Room, None]]: Room if the room with room_code is found, None if there is no room with room_code.
+        """
+
+        if not room_code:
+            yield None
+            return
+
+        with self._store.lock(room_code.lower()):
+            room = self._store.get(room_code.lower())
+            yield room
+
+            if room:
+                self._store.save(room)
+
+    def call_at(self, deadline : float, room : Room, callback : Callable[[Room], None]) -> None:
+        """Schedule a callback for a room. It runs with the room's state at the time it fires.
+
+        Args:
+            deadline (float): The scheduler clock time to fire at.
+            room (Room): The room the callback is for.
+            callback (Callable[[Room], None]): Called with the room, skipped if the room has been closed.
+        """
+
+        scheduler.call_at(deadline, self._run_room_callback, room.room_code, room.instance_id, callback)
+
+    def _run_room_callback(self, room_code : str, instance_id : uuid.UUID, callback : Callable[[Room], None]) -> None:
+        """Run a scheduled callback against the current state of a room.
+
+        Args:
+            room_code (str): The code of the room.
+            instance_id (uuid.UUID): The instance id of the room when the callback was scheduled.
+            callback (Callable[[Room], None]): Called with the room.
+        """
+
+        with self.edit_room(room_code) as room:
+            # the room was closed and its code may have been reused
+            if not room or room.instance_id != instance_id:
+                return
+
+            callback(room)
 
     def _room_exists(self, room_code : str) -> bool:
         """Searches for the room that room_code is associated with and returns a bool.
@@ -357,18 +745,32 @@ class RoomManager():
             bool: True if the room with room_code exists, False if it does not.
         """
 
-        return any(room.room_code == room_code for room in self._active_rooms)
+        return self.get_room(room_code) is not None
 
-    def _create_room(self) -> Room:
-        """Create a new room.
+    def get_room_code_stats(self) -> Dict[str, float]:
+        """Get the occupancy of the room code space.
 
         Returns:
-            Room: The new room.
+            Dict[str, float]: The capacity, the number of codes in use and available, and the fraction in use.
         """
 
-        room = Room(self._next_room_id)
-        self._next_room_id += 1
-        return room
+        return self._store.room_code_stats()
+
+    def get_status_counts(self) -> Tuple[Dict[Tuple[str], int], Dict[Tuple[str], int]]:
+        """Count the active rooms and their users by status, for the metrics endpoint.
+
+        Returns:
+            Tuple[Dict[Tuple[str], int], Dict[Tuple[str], int]]: The number of rooms and the number of users with each status.
+        """
+
+        room_counts = {(status,) : 0 for status in ROOM_STATUSES.values()}
+        user_counts = {(status,) : 0 for status in USER_STATUSES.values()}
+        for room in self._store.rooms():
+            room_counts[(ROOM_STATUSES[room.status],)] += 1
+            for user in room.users:
+                user_counts[(USER_STATUSES[user.status],)] += 1
+
+        return room_counts, user_counts
 
     def wait_host_close_room(self, room : Room) -> None:
         """Mark a room for closure or close it depending on its status. Wait for a few seconds before closing. Checks if the host has reconnected.
@@ -383,7 +785,7 @@ class RoomManager():
         if room.status == 1:
             return
 
-        spawn_after(5, self._host_close_room, room)
+        self.call_at(scheduler.clock() + 5, room, self._host_close_room)
 
     def wait_close_room(self, room : Room) -> None:
         """Mark a room for closure or close it depending on its status. Wait for a few seconds before closing.
@@ -399,7 +801,7 @@ class RoomManager():
             return
 
         # wait some time before closing in case of reconnect
-        spawn_after(5, self._close_room, room)
+        self.call_at(scheduler.clock() + 5, room, self._close_room)
 
     def close_room(self, room : Room) -> None:
         """Mark a room for closure or close it depending on its status. Close it immediately.
@@ -422,16 +824,13 @@ class RoomManager():
             room (Room): The room to close.
         """
 
-        print("Host Checking:", room.room_code)
-
         if not room.host_left:
             return
-        print("Host Closed:", room.room_code)
-        socketio.emit('end_game', room=room.room_code)
 
-        if room in self._active_rooms:
-            self._active_rooms.remove(room)
-            self._open_room_ids.append(room.room_id)
+        rooms_closed.labels('host_left').inc()
+        room.broadcast('end_game')
+
+        self._remove_room(room)
 
     def _close_room(self, room : Room) -> None:
         """Close a room and add it to open rooms.
@@ -440,17 +839,125 @@ class RoomManager():
             room (Room): The room to close.
         """
 
-        print("Checking:", room.room_code)
-
         if not room.is_closed:
             return
-        print("Closed:", room.room_code)
+
+        rooms_closed.labels('closed').inc()
         # in case anyone is still in the room
-        socketio.emit('end_game', room=room.room_code)
+        room.broadcast('end_game')
+
+        self._remove_room(room)
 
-        if room in self._active_rooms:
-            self._active_rooms.remove(room)
-            self._open_room_ids.append(room.room_id)
+    def reap(self) -> ReapReport:
+        """Remove users who have been disconnected for too long and close rooms nobody is using.
+
+        Returns:
+            ReapReport: The number of users and rooms removed.
+        """
+
+        now = scheduler.clock()
+        users = 0
+        rooms = 0
+        for stale_room in self._store.rooms():
+            # only lock the rooms that have something to reap
+            if not self._stale_users(stale_room, now - USER_DISCONNECT_TTL) and not self._is_idle(stale_room, now - ROOM_IDLE_TTL):
+                continue
+
+            with self.edit_room(stale_room.room_code) as room:
+                # the room was closed since the list was read
+                if not room or room.instance_id != stale_room.instance_id:
+                    continue
+
+                users += self._evict_users(room, now - USER_DISCONNECT_TTL)
+
+                # also catches rooms whose round timers were lost, they would otherwise stay in a round forever
+                if self._is_idle(room, now - ROOM_IDLE_TTL):
+                    game_database.release_cursors(user.conn_id for user in room.users)
+                    rooms_closed.labels('idle').inc()
+                    room.is_closed = True
+                    room.broadcast('end_game')
+                    self._remove_room(room)
+                    rooms += 1
+
+        reaped_users.inc(users)
+        report = ReapReport(users, rooms)
+        if users or rooms:
+            print("Reaped:", report)
+
+        return report
+
+    def _evict_users(self, room : Room, cutoff : float) -> int:
+        """Remove the users of a room who have had no connection since before a cutoff. The host is never removed, the room closes without them.
+
+        Args:
+            room (Room): The room, locked for editing.
+            cutoff (float): The scheduler clock time users must have been seen after.
+
+        Returns:
+            int: The number of users removed.
+        """
+
+        evicted = self._stale_users(room, cutoff)
+        for user in evicted:
+            # users are shown by their index, so they are removed one at a time
+            index = room.get_user_index(user.conn_id)
+            room.remove_user(user.conn_id)
+            room.broadcast('remove_user', index)
+
+        game_database.release_cursors(user.conn_id for user in evicted)
+        return len(evicted)
+
+    @staticmethod
+    def _stale_users(room : Room, cutoff : float) -> List[User]:
+        """Get the users of a room who have had no connection since before a cutoff, other than the host.
+
+        Args:
+            room (Room): The room.
+            cutoff (float): The scheduler clock time users must have been seen after.
+
+        Returns:
+            List[User]: The users that would be evicted.
+        """
+
+        return [user for user in room.users if user is not room.host and user.connections <= 0 and user.last_seen < cutoff]
+
+    @staticmethod
+    def _is_idle(room : Room, cutoff : float) -> bool:
+        """Check if nobody is connected to a room and nothing has happened in it since a cutoff.
+
+        Args:
+            room (Room): The room.
+            cutoff (float): The scheduler clock time.
+
+        Returns:
+            bool: If the room is idle.
+        """
+
+        return room.last_active < cutoff and not any(user.connections > 0 for user in room.users)
+
+    def start_reaper(self) -> None:
+        """Reap users and rooms every REAPER_INTERVAL seconds."""
+
+        scheduler.call_later(REAPER_INTERVAL, self._run_reaper)
+
+    def _run_reaper(self) -> None:
+        """Reap if no other worker has this interval and schedule the next sweep."""
+
+        try:
+            if self._store.acquire_lease('reaper', REAPER_LEASE):
+                self.reap()
+
+        finally:
+            scheduler.call_later(REAPER_INTERVAL, self._run_reaper)
+
+    def _remove_room(self, room : Room) -> None:
+        """Remove a room from the active rooms and free its id for reuse.
+
+        Args:
+            room (Room): The room to remove.
+        """
+
+        self._store.remove(room)
 
 def register_socketio(socketio_in : SocketIO) -> None:
     """Register the socket.io connection manager for room management.
@@ -461,5 +968,13 @@ def register_socketio(socketio_in : SocketIO) -> None:
 
     global socketio
     socketio = socketio_in
+    broadcaster.register_socketio(socketio)
+    room_manager.start_reaper()
+    scheduler.start()
 
 room_manager = RoomManager()
+
+# both gauges come from one pass over the rooms
+_status_counts = registry.once_per_scrape(room_manager.get_status_counts)
+registry.gauge('sqlguess_rooms', "Active rooms by status.", lambda: _status_counts()[0], ['status'])
+registry.gauge('sqlguess_users', "Users in active rooms by status.", lambda: _status_counts()[1], ['status'])
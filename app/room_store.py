@@ -0,0 +1,264 @@
+import json
+import time
+import uuid
+import secrets
+from abc import ABC, abstractmethod
+from contextlib import contextmanager, nullcontext
+from multiprocessing.managers import BaseManager
+from typing import Callable, Union, Dict, Iterator, ContextManager, TYPE_CHECKING
+from urllib.parse import urlparse
+from app.room_codes import RoomCodeAllocator, CODE_SPACE, encode_room_code
+
+if TYPE_CHECKING:
+    from app.room_management import Room
+
+# deletes a lock only if it still holds this worker's token, in one step so a lock that expired and was taken by another worker is kept
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+class RoomStore(ABC):
+    """Where the state of active rooms is kept. Rooms are read with get and written back with save."""
+
+    @abstractmethod
+    def allocate_room_id(self) -> Union[int, None]:
+        """Reserve a free room id.
+
+        Returns:
+            Union[int, None]: The room id or None if every room code is in use.
+        """
+
+    @abstractmethod
+    def add(self, room : 'Room') -> None:
+        """Add a new room with a reserved room id."""
+
+    @abstractmethod
+    def get(self, room_code : str) -> Union['Room', None]:
+        """Get the room with a lowercase room code, None if it does not exist."""
+
+    @abstractmethod
+    def save(self, room : 'Room') -> None:
+        """Write back changes to a room. Rooms that have been removed are not added back."""
+
+    @abstractmethod
+    def remove(self, room : 'Room') -> bool:
+        """Remove a room and free its room id.
+
+        Returns:
+            bool: If the room was removed, False if it was already removed or replaced.
+        """
+
+    @abstractmethod
+    def lock(self, room_code : str) -> ContextManager:
+        """Get a context manager that keeps other workers from changing the room while it is held."""
+
+    @abstractmethod
+    def acquire_lease(self, name : str, duration : float) -> bool:
+        """Take a lease so that only one worker runs a periodic job. Leases are not released, they run out after their duration.
+
+        Args:
+            name (str): The job.
+            duration (float): The seconds the lease is held for.
+
+        Returns:
+            bool: If the lease was taken, False if another worker holds it.
+        """
+
+    @abstractmethod
+    def room_code_stats(self) -> Dict[str, float]:
+        """Get the occupancy of the room code space."""
+
+    @abstractmethod
+    def rooms(self) -> Iterator['Room']:
+        """Get every active room, for reporting. It reads every room, so it should not be used while handling events."""
+
+class LocalRoomStore(RoomStore):
+    """Keeps rooms as objects in this process. The default when there is only one worker."""
+
+    def __init__(self, randomize : bool = False):
+        # rooms keyed by their lowercase room code
+        self._rooms = {}
+        self._room_codes = RoomCodeAllocator(randomize=randomize)
+
+    def allocate_room_id(self) -> Union[int, None]:
+        return self._room_codes.allocate()
+
+    def add(self, room : 'Room') -> None:
+        self._rooms[room.room_code] = room
+
+    def get(self, room_code : str) -> Union['Room', None]:
+        return self._rooms.get(room_code)
+
+    def save(self, room : 'Room') -> None:
+        # rooms are changed in place
+        pass
+
+    def remove(self, room : 'Room') -> bool:
+        # only free the id once, the room may have already been replaced by a new one with the same code
+        if self._rooms.get(room.room_code) is not room:
+            return False
+
+        del self._rooms[room.room_code]
+        self._room_codes.release(room.room_id)
+        return True
+
+    def lock(self, room_code : str) -> ContextManager:
+        # greenlets in one process share the same room objects
+        return nullcontext()
+
+    def acquire_lease(self, name : str, duration : float) -> bool:
+        # this is the only worker
+        return True
+
+    def room_code_stats(self) -> Dict[str, float]:
+        return self._room_codes.stats()
+
+    def rooms(self) -> Iterator['Room']:
+        # a copy, rooms may be removed while they are iterated
+        return iter(list(self._rooms.values()))
+
+class SharedRoomStore(RoomStore):
+    """Keeps rooms as JSON in a key-value store shared by every worker, such as Redis.
+
+    Rooms are stored as their plain state, so whoever can write to the store can change rooms but cannot run code in the workers.
+    The codes of reserved rooms are kept in a set so rooms can be listed without scanning every key.
+    The client needs get, mget, set (with nx, xx and px), delete, incr, decr, sadd, srem, smembers and eval of RELEASE_LOCK_SCRIPT like redis.Redis.
+    """
+
+    # the most rooms read with one request when listing them
+    LIST_BATCH_SIZE = 100
+
+    def __init__(self, client, load_room : Callable[[dict], 'Room'], prefix : str = 'sqlguess:', lock_timeout : float = 5.0, allocation_attempts : int = 32):
+        self._client = client
+        # restores a room from its stored state
+        self._load_room = load_room
+        self._prefix = prefix
+        self._lock_timeout = lock_timeout
+        self._allocation_attempts = allocation_attempts
+
+    def allocate_room_id(self) -> Union[int, None]:
+        # workers cannot share a free list, so reserve random codes until one is free
+        for _ in range(self._allocation_attempts):
+            room_id = secrets.randbelow(CODE_SPACE)
+            room_code = encode_room_code(room_id)
+            if self._client.set(self._room_key(room_code), b'', nx=True):
+                self._client.sadd(self._key('room_codes'), room_code)
+                self._client.incr(self._key('rooms_in_use'))
+                return room_id
+
+        return None
+
+    def add(self, room : 'Room') -> None:
+        self._client.set(self._room_key(room.room_code), self._dump(room))
+
+    def get(self, room_code : str) -> Union['Room', None]:
+        data = self._client.get(self._room_key(room_code))
+
+        # an empty value is a reserved code whose room has not been added yet
+        if not data:
+            return None
+
+        return self._load(data)
+
+    def save(self, room : 'Room') -> None:
+        self._client.set(self._room_key(room.room_code), self._dump(room), xx=True)
+
+    def remove(self, room : 'Room') -> bool:
+        current = self.get(room.room_code)
+        if not current or current.instance_id != room.instance_id:
+            return False
+
+        if self._client.delete(self._room_key(room.room_code)):
+            # after the delete, a worker that stops in between leaves a code with no room, which listing skips
+            self._client.srem(self._key('room_codes'), room.room_code)
+            self._client.decr(self._key('rooms_in_use'))
+            return True
+
+        return False
+
+    @contextmanager
+    def lock(self, room_code : str) -> Iterator[None]:
+        key = self._key(f'lock:{room_code}')
+        token = uuid.uuid4().hex.encode()
+
+        # the lock expires on its own in case the worker holding it dies
+        deadline = time.monotonic() + self._lock_timeout
+        while not self._client.set(key, token, nx=True, px=int(self._lock_timeout * 1000)):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Timed out waiting for the lock on room {room_code}")
+
+            time.sleep(0.005)
+
+        try:
+            yield
+
+        finally:
+            self._client.eval(RELEASE_LOCK_SCRIPT, 1, key, token)
+
+    def acquire_lease(self, name : str, duration : float) -> bool:
+        return bool(self._client.set(self._key(f'lease:{name}'), b'', nx=True, px=int(duration * 1000)))
+
+    def room_code_stats(self) -> Dict[str, float]:
+        in_use = int(self._client.get(self._key('rooms_in_use')) or 0)
+        return {
+            'capacity' : CODE_SPACE,
+            'in_use' : in_use,
+            'available' : CODE_SPACE - in_use,
+            'occupancy' : in_use / CODE_SPACE
+        }
+
+    def rooms(self) -> Iterator['Room']:
+        # read a batch at a time so a large number of rooms is never all in memory at once
+        room_codes = [room_code.decode() if isinstance(room_code, bytes) else room_code for room_code in self._client.smembers(self._key('room_codes'))]
+        for start in range(0, len(room_codes), self.LIST_BATCH_SIZE):
+            batch = room_codes[start:start + self.LIST_BATCH_SIZE]
+            for data in self._client.mget([self._room_key(room_code) for room_code in batch]):
+                if data:
+                    yield self._load(data)
+
+    @staticmethod
+    def _dump(room : 'Room') -> bytes:
+        return json.dumps(room.to_state(), separators=(',', ':')).encode()
+
+    def _load(self, data : bytes) -> 'Room':
+        return self._load_room(json.loads(data))
+
+    def _key(self, name : str) -> str:
+        return self._prefix + name
+
+    def _room_key(self, room_code : str) -> str:
+        return self._key(f'room:{room_code}')
+
+class _StoreManager(BaseManager):
+    pass
+
+_StoreManager.register('store')
+
+def create_room_store(url : Union[str, None], load_room : Callable[[dict], 'Room'], randomize : bool = False) -> RoomStore:
+    """Create the room store for a URL.
+
+    Args:
+        url (Union[str, None]): Empty for rooms in this process, redis://... for Redis or memory://host:port for a room_store_server.py process.
+        load_room (Callable[[dict], Room]): Restores a room from the state it was stored as in a shared store.
+        randomize (bool, optional): If local room codes are handed out randomly. Shared room codes are always random. Defaults to False.
+
+    Returns:
+        RoomStore: The room store.
+    """
+
+    if not url:
+        return LocalRoomStore(randomize=randomize)
+
+    parsed_url = urlparse(url)
+
+    if parsed_url.scheme == 'memory':
+        manager = _StoreManager(address=(parsed_url.hostname, parsed_url.port), authkey=(parsed_url.password or 'sqlguess').encode())
+        manager.connect()
+        return SharedRoomStore(manager.store(), load_room) # pylint: disable=no-member
+
+    # redis is only needed when it is used
+    import redis # pylint: disable=import-outside-toplevel
+    return SharedRoomStore(redis.Redis.from_url(url), load_room)
@@ -0,0 +1,172 @@
+import uuid
+import datetime
+from typing import List, NamedTuple, Union, TYPE_CHECKING
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateSchema
+from app.history_models import HistoryBase, RoundResult, RoundPlayer
+from app.metrics import round_history_records
+from app.scheduler import scheduler
+from app.write_behind import WriteBehindQueue
+
+if TYPE_CHECKING:
+    from app.room_management import Room
+
+class PlayerRecord(NamedTuple):
+    user_id: uuid.UUID
+    display_name: str
+    query_count: int
+    guessed_correctly: bool
+    guessed_after: Union[float, None]
+    db_time: float
+
+class RoundRecord(NamedTuple):
+    id: uuid.UUID
+    room_code: str
+    room_instance_id: uuid.UUID
+    round_number: int
+    location_id: Union[int, None]
+    location_name: str
+    hints: List[dict]
+    started_at: float
+    ended_at: float
+    # in rank order
+    players: List[PlayerRecord]
+
+def _to_datetime(clock_time : float) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(clock_time, datetime.timezone.utc)
+
+class RoundHistory(WriteBehindQueue):
+    """Keeps the results of every round in the history schema.
+
+    Rounds are recorded when they end and inserted in batches by a background task, so ending a round never waits on the database.
+    """
+
+    def __init__(self, engine : Union[Engine, None], max_buffer : int = 1000, batch_size : int = 100, flush_interval : float = 5.0):
+        super().__init__(self._insert_rounds if engine is not None else None, round_history_records, max_buffer, batch_size, flush_interval)
+        self.engine = engine
+        self._created = False
+
+    def record_round(self, room : 'Room') -> None:
+        """Buffer the results of a room's round that just ended.
+
+        Args:
+            room (Room): The room, before its hints and query counts are reset.
+        """
+
+        if not self.enabled or room.round_started_at is None:
+            return
+
+        players = []
+        for user in room.scoreboard.ranked_users():
+            guessed_after = None
+            if user.guessed_at is not None:
+                guessed_after = max(0.0, user.guessed_at - room.round_started_at)
+
+            players.append(PlayerRecord(user.conn_id, user.display_name, user.query_count, user.guessed_correctly, guessed_after, user.query_limits.db_time))
+
+        location = room.location
+        self.put(RoundRecord(
+            uuid.uuid4(),
+            room.room_code,
+            room.instance_id,
+            room.round_number,
+            getattr(location, 'id', None),
+            location.name,
+            [{'name' : name, 'value' : value} for name, value in room.given_hints],
+            room.round_started_at,
+            scheduler.clock(),
+            players
+            ))
+
+    def recent_rounds(self, limit : int = 20, room_code : Union[str, None] = None) -> List[dict]:
+        """Get the most recently ended rounds with their players.
+
+        Args:
+            limit (int, optional): The most rounds to return. Defaults to 20.
+            room_code (Union[str, None], optional): Only return rounds played in the room with this code. Defaults to None.
+
+        Returns:
+            List[dict]: The rounds, newest first, with their players in rank order.
+        """
+
+        self._ensure_tables()
+
+        rounds = RoundResult.__table__
+        players = RoundPlayer.__table__
+
+        # both orders match an index, so only the rounds that are returned are read
+        query = select(rounds).order_by(rounds.c.ended_at.desc()).limit(limit)
+        if room_code:
+            query = query.where(rounds.c.room_code == room_code.lower())
+
+        with self.engine.connect() as conn:
+            round_rows = conn.execute(query).fetchall()
+            if not round_rows:
+                return []
+
+            player_rows = conn.execute(
+                select(players).where(players.c.round_id.in_([row.round_id for row in round_rows])).order_by(players.c.round_id, players.c.rank)
+                ).fetchall()
+
+        round_players = {}
+        for row in player_rows:
+            round_players.setdefault(row.round_id, []).append({
+                'display_name' : row.display_name,
+                'query_count' : row.query_count,
+                'guessed_correctly' : row.guessed_correctly,
+                'guessed_after' : row.guessed_after,
+                'db_time' : row.db_time
+                })
+
+        return [{
+            'room_code' : row.room_code,
+            'round_number' : row.round_number,
+            'location' : row.location_name,
+            'hints' : row.hints,
+            'started_at' : row.started_at.isoformat(),
+            'ended_at' : row.ended_at.isoformat(),
+            'players' : round_players.get(row.round_id, [])
+            } for row in round_rows]
+
+    def _insert_rounds(self, records : List[RoundRecord]) -> None:
+        """Insert a batch of rounds and their players in one transaction."""
+
+        self._ensure_tables()
+
+        round_rows = []
+        player_rows = []
+        for record in records:
+            round_rows.append({
+                'round_id' : record.id,
+                'room_code' : record.room_code,
+                'room_instance_id' : record.room_instance_id,
+                'round_number' : record.round_number,
+                'location_id' : record.location_id,
+                'location_name' : record.location_name,
+                'hints' : record.hints,
+                'started_at' : _to_datetime(record.started_at),
+                'ended_at' : _to_datetime(record.ended_at)
+                })
+
+            for rank, player in enumerate(record.players, 1):
+                player_row = player._asdict()
+                player_row.update(round_id=record.id, rank=rank)
+                player_rows.append(player_row)
+
+        with self.engine.begin() as conn:
+            conn.execute(RoundResult.__table__.insert(), round_rows)
+            if player_rows:
+                conn.execute(RoundPlayer.__table__.insert(), player_rows)
+
+    def _ensure_tables(self) -> None:
+        """Create the history schema and its tables the first time they are used."""
+
+        if self._created:
+            return
+
+        if not self.engine.dialect.has_schema(self.engine, 'history'):
+            self.engine.execute(CreateSchema('history'))
+
+        HistoryBase.metadata.create_all(self.engine)
+        self._created = True
@@ -0,0 +1,148 @@
+import heapq
+import itertools
+import time
+import traceback
+from typing import Callable, Union
+import eventlet
+from greenlet import getcurrent
+from app.metrics import scheduler_errors
+
+class ScheduledCall():
+    __slots__ = ('deadline', 'callback', 'args', 'cancelled')
+
+    def __init__(self, deadline : float, callback : Callable, args : tuple):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """Stop the call from firing. The entry is discarded lazily when its deadline is reached."""
+
+        self.cancelled = True
+
+class FakeClock():
+    def __init__(self, start : float = 0.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds : float) -> None:
+        """Move the clock forward.
+
+        Args:
+            seconds (float): The number of seconds to move forward by.
+        """
+
+        self.now += seconds
+
+class Scheduler():
+    def __init__(self, clock : Callable[[], float] = time.time, resolution : float = 0.1):
+        # wall clock time so deadlines stored on rooms can be compared anywhere
+        self.clock = clock
+        self.resolution = resolution
+
+        self._heap = []
+        self._counter = itertools.count()
+        self._thread = None
+        self._stopping = False
+
+    def call_at(self, deadline : float, callback : Callable, *args) -> ScheduledCall:
+        """Schedule a callback to fire at a point in time.
+
+        Args:
+            deadline (float): The clock time to fire at.
+            callback (Callable): The function to call.
+
+        Returns:
+            ScheduledCall: A handle that can cancel the call.
+        """
+
+        call = ScheduledCall(deadline, callback, args)
+        # counter keeps calls with the same deadline in the order they were scheduled
+        heapq.heappush(self._heap, (deadline, next(self._counter), call))
+        return call
+
+    def call_later(self, delay : float, callback : Callable, *args) -> ScheduledCall:
+        """Schedule a callback to fire after a delay.
+
+        Args:
+            delay (float): The number of seconds to wait.
+            callback (Callable): The function to call.
+
+        Returns:
+            ScheduledCall: A handle that can cancel the call.
+        """
+
+        return self.call_at(self.clock() + delay, callback, *args)
+
+    def next_deadline(self) -> Union[float, None]:
+        """Get the deadline of the next scheduled call.
+
+        Returns:
+            Union[float, None]: The deadline or None if nothing is scheduled.
+        """
+
+        return self._heap[0][0] if self._heap else None
+
+    def run_pending(self) -> int:
+        """Fire every call whose deadline has passed, in deadline order.
+
+        Returns:
+            int: The number of calls that were fired.
+        """
+
+        fired = 0
+        while self._heap and self._heap[0][0] <= self.clock():
+            _, _, call = heapq.heappop(self._heap)
+            if call.cancelled:
+                continue
+
+            try:
+                call.callback(*call.args)
+            except Exception: # pylint: disable=broad-except
+                # one room's failure should not stop the other rooms' timers
+                traceback.print_exc()
+                scheduler_errors.inc()
+
+            fired += 1
+
+        return fired
+
+    def start(self) -> None:
+        """Start the green thread that fires scheduled calls. Unlike a background thread, it does not keep the process from exiting."""
+
+        if self._thread is not None:
+            return
+
+        self._stopping = False
+        self._thread = eventlet.spawn(self._run)
+
+    def stop(self) -> None:
+        """Stop firing scheduled calls, after the calls that are due now. Calls that are still scheduled fire if the scheduler is started again."""
+
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+
+        self._stopping = True
+        # a scheduled call can stop the scheduler, it stops once that call returns
+        if thread is not getcurrent():
+            thread.wait()
+
+    def _run(self) -> None:
+        """Fire scheduled calls until the scheduler is stopped."""
+
+        while not self._stopping:
+            self.run_pending()
+
+            # sleep until the next deadline, waking regularly to pick up newly scheduled calls
+            next_deadline = self.next_deadline()
+            delay = self.resolution
+            if next_deadline is not None:
+                delay = min(delay, max(next_deadline - self.clock(), 0))
+
+            eventlet.sleep(delay)
+
+scheduler = Scheduler()
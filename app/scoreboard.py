@@ -0,0 +1,99 @@
+from bisect import bisect_left, insort
+from typing import Dict, List, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from app.room_management import User
+
+class Scoreboard():
+    """Users ranked by a correct guess first, then by fewest queries, then by when they joined.
+
+    The ranking is kept sorted as users change, so the standings never need to be sorted.
+    """
+
+    def __init__(self):
+        # sorted (not guessed correctly, query count, join order) keys
+        self._keys : List[Tuple[int, int, int]] = []
+        # join order -> user
+        self._users : Dict[int, 'User'] = {}
+        # user conn id -> the user's current key
+        self._user_keys = {}
+        self._next_order = 0
+
+    def add(self, user : 'User') -> None:
+        """Add a user to the ranking.
+
+        Args:
+            user (User): The new user.
+        """
+
+        order = self._next_order
+        self._next_order += 1
+
+        key = (int(not user.guessed_correctly), user.query_count, order)
+        self._users[order] = user
+        self._user_keys[user.conn_id] = key
+        insort(self._keys, key)
+
+    def update(self, user : 'User') -> bool:
+        """Move a user to their rank after their query count or guess changed.
+
+        Args:
+            user (User): The changed user.
+
+        Returns:
+            bool: If the user's key changed.
+        """
+
+        old_key = self._user_keys[user.conn_id]
+        key = (int(not user.guessed_correctly), user.query_count, old_key[2])
+        if key == old_key:
+            return False
+
+        del self._keys[bisect_left(self._keys, old_key)]
+        insort(self._keys, key)
+        self._user_keys[user.conn_id] = key
+        return True
+
+    def remove(self, user : 'User') -> None:
+        """Remove a user from the ranking.
+
+        Args:
+            user (User): The user to remove.
+        """
+
+        key = self._user_keys.pop(user.conn_id, None)
+        if key is None:
+            return
+
+        del self._keys[bisect_left(self._keys, key)]
+        del self._users[key[2]]
+
+    def reset(self) -> None:
+        """Re-rank every user after their query counts and guesses were reset, keeping the join order."""
+
+        self._keys = []
+        for order in sorted(self._users):
+            user = self._users[order]
+            key = (int(not user.guessed_correctly), user.query_count, order)
+            self._user_keys[user.conn_id] = key
+            self._keys.append(key)
+
+        self._keys.sort()
+
+    def ranked_users(self) -> List['User']:
+        """Get the users in rank order.
+
+        Returns:
+            List[User]: The users.
+        """
+
+        return [self._users[key[2]] for key in self._keys]
+
+    def standings(self) -> List[Tuple[str, int, bool]]:
+        """Get the users in rank order.
+
+        Returns:
+            List[Tuple[str, int, bool]]: The display name, query count and if the user guessed correctly.
+        """
+
+        return [(user.display_name, user.query_count, user.guessed_correctly) for user in self.ranked_users()]
@@ -1,103 +1,175 @@
+import os
 import json
-from flask import session
+import time
+from functools import wraps
+from typing import Callable
+from flask import session, request
 from flask_socketio import SocketIO, emit, join_room
 from app import app, game_database, room_manager
+from app.audit_log import AuditRecord
+from app.broadcast import broadcaster
+from app.metrics import socket_event_seconds, socket_event_errors
+from app.query_cache import normalize_query
 
 import eventlet
 eventlet.monkey_patch()
 
-socketio = SocketIO(app, async_mode='eventlet')
+# with several workers, emits go through the message queue so they reach players connected to any worker
+socketio = SocketIO(app, async_mode='eventlet', message_queue=os.environ.get('SOCKETIO_MESSAGE_QUEUE'))
 
-@socketio.on('connect')
+def on(event : str) -> Callable[[Callable], Callable]:
+    """Register a socket.io event handler that is timed and counted on the metrics endpoint.
+
+    Args:
+        event (str): The name of the event.
+
+    Returns:
+        Callable[[Callable], Callable]: The decorator for the handler.
+    """
+
+    latency = socket_event_seconds.labels(event)
+    errors = socket_event_errors.labels(event)
+
+    def decorator(handler : Callable) -> Callable:
+        @wraps(handler)
+        def timed_handler(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+
+            except Exception:
+                errors.inc()
+                raise
+
+            finally:
+                latency.observe(time.perf_counter() - start)
+
+        return socketio.on(event)(timed_handler)
+
+    return decorator
+
+@on('connect')
 def connect_user():
-    room = room_manager.get_room(session.get('room_code'))
+    with room_manager.edit_room(session.get('room_code')) as room:
+        if not room:
+            return
 
-    if not room:
-        return
+        if room.is_closed and not room.host_left:
+            room.is_closed = False
 
-    if room.is_closed and not room.host_left:
-        room.is_closed = False
+        user_conn_id = session.get('_id')
+        user = room.get_user(user_conn_id)
+        if not user:
+            return
 
-    user_conn_id = session.get('_id')
-    user = room.get_user(user_conn_id)
-    if not user:
-        return
+        if room.is_host(user_conn_id):
+            room.host_left = False
+            room.is_closed = False
+
+        user.connections += 1
+
+        # if user was disconnected, reconnect and remove disconnected flag
+        if user.status == 0:
+            user.status = 1
+            room.broadcast('user_reconnect', room.get_user_index(user_conn_id), skip_sid=request.sid)
+
+        # connecting for the first time
+        # tell others that the user has joined
+        # the joining user skips it, they receive the full list of users instead
+        elif user.status == 2:
+            user.status = 1
+            room.broadcast('add_user', user.display_name, skip_sid=request.sid)
+
+@on('resync')
+def resync_user(data=None):
+    with room_manager.edit_room(session.get('room_code')) as room:
+        if not room:
+            return
+
+        user = room.get_user(session.get('_id'))
+        if not user:
+            return
+
+        # once connected, a client sends the last version of the room it saw, a reconnecting client only needs what changed since
+        client_version = data.get('version') if isinstance(data, dict) else None
+        changes = room.get_changes_since(client_version) if isinstance(client_version, int) else None
 
-    if room.is_host(user_conn_id):
-        room.host_left = False
-        room.is_closed = False
-
-    user.connections += 1
-
-    # if user was disconnected, reconnect and remove disconnected flag
-    if user.status == 0:
-        user.status = 1
-        emit('user_reconnect', room.get_user_index(user_conn_id), room=room.room_code)
-
-    # connecting for the first time
-    # tell others that the user has joined
-    # have to do this before user joins or joining user will receive the emit too, alongside the full list of users
-    elif user.status == 2:
-        user.status = 1
-        emit('add_user', user.display_name, room=room.room_code)
-        
-    output = {
-        'users' : room.get_display_names_and_statuses(),
-        'hints' : room.given_hints,
-        'query_count' : user.query_count,
-        }
-
-    # add end round data if the room is currently in that phase
-    if room.status == 2:
-        output['user_query_counts'] = room.get_user_query_counts()
-        output['correct_location'] = room.location.name
-
-    join_room(room.room_code)
-
-    # send full list of display names to user who joined
-    emit('join_room', json.dumps(output))
-
-@socketio.on('disconnect')
+        if changes is not None:
+            event = 'resync'
+            output = {
+                'version' : room.version,
+                'changes' : changes,
+                'status' : room.status,
+                'current_time' : room.current_time,
+                'query_count' : user.query_count,
+                }
+
+        else:
+            event = 'join_room'
+            output = {
+                'version' : room.version,
+                'status' : room.status,
+                'current_time' : room.current_time,
+                'users' : room.get_display_names_and_statuses(),
+                'hints' : room.given_hints,
+                'query_count' : user.query_count,
+                }
+
+            if room.status == 1:
+                output['scoreboard'] = room.get_user_query_counts()
+
+            # add end round data if the room is currently in that phase
+            elif room.status == 2:
+                output['user_query_counts'] = room.get_user_query_counts()
+                output['correct_location'] = room.location.name
+
+        # events already in the room state must not reach the user a second time
+        broadcaster.flush(room.room_code)
+        join_room(room.room_code)
+
+    # send full list of display names or the missed changes to user who joined
+    emit(event, json.dumps(output))
+
+@on('disconnect')
 def remove_user():
     room_code = session.get('room_code')
-    room = room_manager.get_room(room_code)
-    if not room:
-        return
+    with room_manager.edit_room(room_code) as room:
+        if not room:
+            return
 
-    user_conn_id = session.get('_id')
-    if not user_conn_id:
-        return
+        user_conn_id = session.get('_id')
+        if not user_conn_id:
+            return
 
-    index = room.get_user_index(user_conn_id)
-    if index is None:
-        return
+        index = room.get_user_index(user_conn_id)
+        if index is None:
+            return
 
-    user = room.get_user(user_conn_id)
-    user.connections -= 1
+        user = room.get_user(user_conn_id)
+        user.connections -= 1
 
-    # if user does not have any other connections, disconnect
-    if not user.connections:
-        room.disconnect_user(user_conn_id)
-        emit('user_disconnect', index, room=room_code)
+        # if user does not have any other connections, disconnect
+        if not user.connections:
+            room.disconnect_user(user_conn_id)
+            room.broadcast('user_disconnect', index)
 
-@socketio.on('start_game')
+@on('start_game')
 def start_game():
-    room = room_manager.get_room(session.get('room_code'))
-    if not room:
-        return
-
-    # if game has started already
-    if room.status:
-        return
+    with room_manager.edit_room(session.get('room_code')) as room:
+        if not room:
+            return
 
-    if not room.is_host(session.get('_id')):
-        return
+        # if game has started already
+        if room.status:
+            return
 
-    room.start()
+        if not room.is_host(session.get('_id')):
+            return
 
-    emit('start_game', room=room.room_code)
+        room.start()
+        room.broadcast('start_game')
 
-@socketio.on('guess')
+@on('guess')
 def guess(guess_text):
     output = {}
 
@@ -109,23 +181,22 @@ def guess(guess_text):
         output['error'] = "Bad Request, guess is over 1000 characters"
 
     else:
-        room = room_manager.get_room(session.get('room_code'))
+        with room_manager.edit_room(session.get('room_code')) as room:
+            # if room has not started yet
+            if not room or not room.status:
+                return
 
-        # if room has not started yet
-        if not room.status:
-            return
+            user = room.get_user(session.get('_id'))
+            if not user:
+                output['error'] = "Not Authenticated, you are not validated for this room"
 
-        user = room.get_user(session.get('_id'))
-        if not user:
-            output['error'] = "Not Authenticated, you are not validated for this room"
-
-        else:
-            output['result'] = room.check_guess(user, guess_text)
+            else:
+                output['result'] = room.check_guess(user, guess_text)
 
     emit('guess', output)
 
 
-@socketio.on('query')
+@on('query')
 def query(query_text):
     output = {}
 
@@ -136,48 +207,108 @@ def query(query_text):
         output['error'] = "Bad Request, query is over 1000 characters"
 
     else:
-        room = room_manager.get_room(session.get('room_code'))
-
-        if not room.status:
+        # only lock the room to check the limits and to count the query, not while it runs
+        with room_manager.edit_room(session.get('room_code')) as room:
+            if not room or not room.status:
+                return
+
+            user = room.get_user(session.get('_id'))
+            if not user:
+                emit('query', {'error' : "Not Authenticated, you are not validated for this room"})
+                return
+
+            rejection = room.admit_query(user)
+
+        if rejection:
+            # turned away queries are audited too, they are what abuse looks like
+            game_database.audit_log.record(AuditRecord(room.room_code, str(user.conn_id), normalize_query(query_text), 0.0, error=rejection['error']))
+            emit('query', rejection)
             return
 
-        user = room.get_user(session.get('_id'))
-        if not user:
-            output['error'] = "Not Authenticated, you are not validated for this room"
+        # queries are only worth running while the round they are for has time left
+        deadline = room.round_deadline if room.status == 1 else None
 
-        else:
-            output = game_database.execute_user_input(query_text)
+        # only the time the query ran counts against the database time budgets, not its wait for a slot
+        output = game_database.execute_user_input(query_text, user.conn_id, room.room_code, deadline)
+        db_time = output.pop('db_time', 0.0)
+
+        # a query the executor was too busy for is not counted
+        if output.get('rate_limited'):
+            emit('query', output)
+            return
+
+        with room_manager.edit_room(room.room_code) as room:
+            user = room.get_user(user.conn_id) if room else None
+            if user:
+                room.record_query(user, db_time)
 
-    user.query_count += 1
     emit('query', output)
 
-@socketio.on('next_round')
-def next_round():
+@on('next_page')
+def next_page():
     room = room_manager.get_room(session.get('room_code'))
     if not room:
         return
 
-    # if room is not in-between rounds
-    if not room.status == 2:
+    # pages can only be read during the round
+    if not room.status == 1:
         return
 
-    if not room.is_host(session.get('_id')):
+    user = room.get_user(session.get('_id'))
+    if not user:
+        emit('next_page', {'error' : "Not Authenticated, you are not validated for this room"})
         return
 
-    room.next_round()
+    # reading a page uses the database too, so it counts against the same limits
+    with room_manager.edit_room(room.room_code) as room:
+        user = room.get_user(user.conn_id) if room else None
+        if not user:
+            return
 
-@socketio.on('end_game')
-def end_game():
-    room = room_manager.get_room(session.get('room_code'))
-    if not room:
-        return
+        rejection = room.admit_query(user)
 
-    # if room is not in-between rounds
-    if not room.status == 2:
+    if rejection:
+        emit('next_page', rejection)
         return
 
-    if not room.is_host(session.get('_id')):
-        return
+    start = time.perf_counter()
+    output = game_database.fetch_next_page(user.conn_id)
+    db_time = time.perf_counter() - start
+
+    with room_manager.edit_room(room.room_code) as room:
+        user = room.get_user(user.conn_id) if room else None
+        if user:
+            room.record_query(user, db_time, count=False)
+
+    emit('next_page', output)
+
+@on('next_round')
+def next_round():
+    with room_manager.edit_room(session.get('room_code')) as room:
+        if not room:
+            return
+
+        # if room is not in-between rounds
+        if not room.status == 2:
+            return
+
+        if not room.is_host(session.get('_id')):
+            return
+
+        room.next_round()
+
+@on('end_game')
+def end_game():
+    with room_manager.edit_room(session.get('room_code')) as room:
+        if not room:
+            return
+
+        # if room is not in-between rounds
+        if not room.status == 2:
+            return
+
+        if not room.is_host(session.get('_id')):
+            return
 
-    room_manager.close_room(room)
-    socketio.emit('end_game', room=room.room_code)
+        room_manager.close_room(room)
+        room.broadcast('end_game')
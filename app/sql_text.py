@@ -0,0 +1,95 @@
+import re
+from typing import Iterator, List, Tuple
+
+# the start of a comment or of anything quoted, the rest of the query is code
+# E'' strings and $tag$ quotes only start where they cannot be the end of an identifier
+_SPECIAL = re.compile(r"--|/\*|(?<![A-Za-z0-9_$])[eE]'|'|\"|(?<![A-Za-z0-9_$])\$(?:[A-Za-z_][A-Za-z0-9_]*)?\$")
+_BLOCK_COMMENT = re.compile(r'/\*|\*/')
+
+# the rest of a quoted string after its opening quote, up to and including the closing quote
+_STRING_END = re.compile(r"(?:[^']|'')*'")
+_ESCAPE_STRING_END = re.compile(r"(?:[^'\\]|\\.|'')*'", re.DOTALL)
+_IDENTIFIER_END = re.compile(r'(?:[^"]|"")*"')
+
+def _block_comment_end(query : str, start : int) -> int:
+    # block comments nest in postgres
+    depth = 0
+    for match in _BLOCK_COMMENT.finditer(query, start):
+        depth += 1 if match.group() == '/*' else -1
+        if depth == 0:
+            return match.end()
+
+    return len(query)
+
+def scan(query : str) -> Iterator[Tuple[str, str]]:
+    """Split a query into code, quoted text and comments, the way postgres reads them.
+
+    Args:
+        query (str): The query input from the user.
+
+    Yields:
+        Iterator[Tuple[str, str]]: 'code', 'quoted' or 'comment' and the text of that part, which together make up the query.
+            Quoted parts are string literals, quoted identifiers and dollar quoted strings. A line comment does not include its newline.
+    """
+
+    pos = 0
+    while pos < len(query):
+        match = _SPECIAL.search(query, pos)
+        if not match:
+            yield 'code', query[pos:]
+            return
+
+        start = match.start()
+        if start > pos:
+            yield 'code', query[pos:start]
+
+        token = match.group()
+        kind = 'quoted'
+        if token == '--':
+            kind = 'comment'
+            end = query.find('\n', start)
+            end = len(query) if end < 0 else end
+
+        elif token == '/*':
+            kind = 'comment'
+            end = _block_comment_end(query, start)
+
+        elif token.startswith('$'):
+            end = query.find(token, match.end())
+            end = len(query) if end < 0 else end + len(token)
+
+        else:
+            pattern = {"'" : _STRING_END, '"' : _IDENTIFIER_END}.get(token, _ESCAPE_STRING_END)
+            end_match = pattern.match(query, match.end())
+            # an unterminated quote runs to the end, postgres rejects the query anyway
+            end = end_match.end() if end_match else len(query)
+
+        yield kind, query[start:end]
+        pos = end
+
+def split_statements(query : str) -> List[str]:
+    """Split a query into its statements on the semicolons that are not quoted or commented out. Comments are removed.
+
+    Args:
+        query (str): The query input from the user.
+
+    Returns:
+        List[str]: The statements that are not empty.
+    """
+
+    statements = ['']
+    for kind, part in scan(query):
+        if kind == 'comment':
+            # a comment separates tokens like whitespace does
+            statements[-1] += ' '
+            continue
+
+        if kind == 'quoted':
+            statements[-1] += part
+            continue
+
+        pieces = part.split(';')
+        statements[-1] += pieces[0]
+        statements.extend(pieces[1:])
+
+    return [statement.strip() for statement in statements if statement.strip()]
@@ -0,0 +1,167 @@
+import time
+import uuid
+import sqlite3
+from collections import deque
+from typing import Callable, Union
+import eventlet
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import sessionmaker
+from app.game_models import Base
+
+# the sqlite authorizer action codes that reading a query needs
+_ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, getattr(sqlite3, 'SQLITE_RECURSIVE', 33)}
+# functions that can allocate a lot of memory in a single step, which the progress handler cannot interrupt
+_DENIED_FUNCTIONS = {'zeroblob', 'randomblob'}
+
+def _authorize(action : int, _arg1 : Union[str, None], arg2 : Union[str, None], _database : Union[str, None], _trigger : Union[str, None]) -> int:
+    if action not in _ALLOWED_ACTIONS:
+        return sqlite3.SQLITE_DENY
+
+    # the function name is the second argument of a function action
+    if action == sqlite3.SQLITE_FUNCTION and (arg2 or '').lower() in _DENIED_FUNCTIONS:
+        return sqlite3.SQLITE_DENY
+
+    return sqlite3.SQLITE_OK
+
+class ReplicaConnection(sqlite3.Connection):
+    """A connection to the replica that knows which copy of the game schema it reads and when its query must stop."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.generation = 0
+        self.deadline = float('inf')
+
+class SQLiteReplica():
+    """A read-only copy of the game schema in an in-memory SQLite database shared by the connections of this worker.
+
+    Player queries run in this process without a network round trip. Each query is stopped by a progress handler
+    once it runs past its timeout, and the handler also lets other greenlets run while a long query is stepped.
+    """
+
+    def __init__(self, timeout : float = 0.5, progress_steps : int = 10000, max_idle : int = 8):
+        self.timeout = timeout
+        self.progress_steps = progress_steps
+        self.max_idle = max_idle
+
+        self._uri = None
+        # keeps the current in-memory database alive while no query is reading it
+        self._keeper = None
+        self._generation = 0
+        self._idle = deque()
+
+    def load(self, session_factory : sessionmaker) -> None:
+        """Copy every table of the game schema into a new in-memory database and switch new queries to it.
+
+        Args:
+            session_factory (sessionmaker): Creates sessions on the database that has the game schema.
+        """
+
+        uri = f'file:sqlguess_{uuid.uuid4().hex}?mode=memory&cache=shared'
+        builder = sqlite3.connect(':memory:', uri=True, check_same_thread=False, isolation_level=None)
+        try:
+            self._copy_tables(builder, uri, session_factory)
+
+        except BaseException:
+            # nothing else has the new copy attached, so closing the builder frees it and the current copy stays in use
+            builder.close()
+            raise
+
+        old_keeper = self._keeper
+        self._uri = uri
+        self._keeper = builder
+        self._generation += 1
+
+        # idle connections read the old copy, queries still paging through it keep it alive until they finish
+        while self._idle:
+            self._idle.pop().close()
+
+        if old_keeper is not None:
+            old_keeper.close()
+
+    @staticmethod
+    def _copy_tables(builder : sqlite3.Connection, uri : str, session_factory : sessionmaker) -> None:
+        """Attach a new in-memory database to the builder connection and copy every table of the game schema into it."""
+
+        builder.execute('ATTACH DATABASE ? AS game', (uri,))
+
+        dialect = sqlite.dialect()
+        session = session_factory()
+        try:
+            builder.execute('BEGIN')
+            for table in Base.metadata.sorted_tables:
+                columns = [f'{column.name} {column.type.compile(dialect=dialect)}' for column in table.columns]
+                columns.append(f"PRIMARY KEY ({', '.join(column.name for column in table.primary_key.columns)})")
+                builder.execute(f"CREATE TABLE game.{table.name} ({', '.join(columns)})")
+
+                rows = session.execute(table.select()).fetchall()
+                builder.executemany(f"INSERT INTO game.{table.name} VALUES ({', '.join('?' * len(table.columns))})", [tuple(row) for row in rows])
+
+            builder.execute('COMMIT')
+
+        finally:
+            session.close()
+
+        # give the planner statistics, like postgres has
+        builder.execute('ANALYZE game')
+
+    def getconn(self) -> ReplicaConnection:
+        """Get a read-only connection to the current copy of the game schema.
+
+        Returns:
+            ReplicaConnection: The connection.
+        """
+
+        if self._idle:
+            return self._idle.pop()
+
+        conn = sqlite3.connect(':memory:', uri=True, check_same_thread=False, isolation_level=None, factory=ReplicaConnection)
+        conn.execute('ATTACH DATABASE ? AS game', (self._uri,))
+        conn.execute('PRAGMA query_only = ON')
+        conn.generation = self._generation
+
+        # players can only read, so pragmas, attaching other files and writes are refused when the query is prepared
+        conn.set_authorizer(_authorize)
+        conn.set_progress_handler(self._progress_handler(conn), self.progress_steps)
+        return conn
+
+    def putconn(self, conn : ReplicaConnection, close : bool = False) -> None:
+        """Return a connection once its cursor has been closed.
+
+        Args:
+            conn (ReplicaConnection): The connection.
+            close (bool, optional): Close the connection instead of reusing it. Defaults to False.
+        """
+
+        conn.deadline = float('inf')
+        if close or conn.generation != self._generation or len(self._idle) >= self.max_idle:
+            conn.close()
+            return
+
+        self._idle.append(conn)
+
+    def start_timer(self, conn : ReplicaConnection) -> None:
+        """Give the next statement or page read on a connection the full timeout.
+
+        Args:
+            conn (ReplicaConnection): The connection.
+        """
+
+        conn.deadline = time.perf_counter() + self.timeout
+
+    @staticmethod
+    def is_timeout(e : Exception) -> bool:
+        """Check if an exception was raised because the progress handler stopped a query."""
+
+        return isinstance(e, sqlite3.OperationalError) and str(e) == 'interrupted'
+
+    @staticmethod
+    def _progress_handler(conn : ReplicaConnection) -> Callable[[], int]:
+        def progress() -> int:
+            if time.perf_counter() > conn.deadline:
+                # a non-zero return interrupts the query
+                return 1
+
+            eventlet.sleep(0)
+            return 0
+
+        return progress
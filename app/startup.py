@@ -0,0 +1,31 @@
+import time
+from typing import List, Tuple
+
+class StartupTimer():
+    """Times the phases of starting up so slow ones show up in the logs."""
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._last = self._start
+        self.phases : List[Tuple[str, float]] = []
+
+    def mark(self, phase : str) -> None:
+        """End a phase that started when the previous one ended.
+
+        Args:
+            phase (str): The name of the phase.
+        """
+
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self, title : str) -> None:
+        """Print how long each phase took.
+
+        Args:
+            title (str): What finished starting.
+        """
+
+        phases = ', '.join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in self.phases)
+        print(f"{title} in {(self._last - self._start) * 1000:.0f}ms: {phases}")
@@ -34,10 +34,28 @@ function parseGuessResponse(response){
     guessButtonElement.disabled = false;
 }
 
+//a query turned away by a limit is not counted, the query button waits until it can be tried again
+function parseRateLimited(response){
+    queryOutputElement.innerHTML = "";
+    addError(queryOutputElement, response["error"]);
+
+    if (response["retry_after"] === null) return;
+    setTimeout(() => {
+        queryButtonElement.disabled = false;
+        nextPageButtonElement.disabled = false;
+    }, response["retry_after"] * 1000);
+}
+
 function parseQueryResponse(response){
+    if (response["rate_limited"]){
+        parseRateLimited(response);
+        return;
+    }
+
     queryOutputElement.innerHTML = "";
     if (response["error"]){
         addError(queryOutputElement, response["error"])
+        updateTruncated(false);
     }
     
     else{
@@ -62,30 +80,87 @@ function parseQueryResponse(response){
         resultElement.appendChild(thead);
 
         let tbody = document.createElement("tbody");
+        appendResultRows(tbody, response["result"], response["offset"]);
+        resultElement.appendChild(tbody);
 
-        for ([index, row] of Object.entries(response["result"])){
-            let newTr = document.createElement("tr");
-            let newTh = document.createElement("th");
-            newTh.scope = "row";
-            newTh.textContent = index;
-            newTr.appendChild(newTh);
+        updateTruncated(response["truncated"]);
+    }
+
+    queryCount++;
+    updateQueryCount();
+
+    queryButtonElement.disabled = false;
+}
+
+function requestNextPage(){
+    nextPageButtonElement.disabled = true;
+    socket.emit("next_page");
+}
+
+function parseNextPageResponse(response){
+    if (response["rate_limited"]){
+        parseRateLimited(response);
+        return;
+    }
+
+    queryOutputElement.innerHTML = "";
+    if (response["error"]){
+        addError(queryOutputElement, response["error"]);
+        updateTruncated(false);
+        return;
+    }
+
+    appendResultRows(resultElement.getElementsByTagName("tbody")[0], response["result"], response["offset"]);
+    updateTruncated(response["truncated"]);
+}
+
+//turn a page sent one array per column, possibly deflated, back into rows
+async function decodeResult(response){
+    if (!response["encoding"]) return response;
 
-            for (let attrValue of row){
-                let newTd = document.createElement("td");
-                newTd.textContent = attrValue;
-                newTr.appendChild(newTd);
-            }
+    let body = response;
+    if (response["encoding"] == "columns+deflate"){
+        let stream = new Blob([response["data"]]).stream().pipeThrough(new DecompressionStream("deflate"));
+        body = JSON.parse(await new Response(stream).text());
+    }
+
+    let values = body["values"];
+    let rows = [];
+    for (let i = 0; i < body["row_count"]; i++){
+        rows.push(values.map(column => column[i]));
+    }
 
-            tbody.appendChild(newTr);
+    return {...response, "columns": body["columns"], "result": rows};
+}
+
+function appendResultRows(tbody, rows, offset){
+    for (let [index, row] of rows.entries()){
+        let newTr = document.createElement("tr");
+        let newTh = document.createElement("th");
+        newTh.scope = "row";
+        newTh.textContent = offset + index;
+        newTr.appendChild(newTh);
+
+        for (let attrValue of row){
+            let newTd = document.createElement("td");
+            newTd.textContent = attrValue;
+            newTr.appendChild(newTd);
         }
 
-        resultElement.appendChild(tbody);
+        tbody.appendChild(newTr);
     }
+}
 
-    queryCount++;
-    updateQueryCount();
+function updateTruncated(truncated){
+    if (truncated){
+        addInfo(queryOutputElement, "Only part of the results are shown, load the next page for more rows.");
+        nextPageButtonElement.className = "btn btn-secondary mt-2";
+        nextPageButtonElement.disabled = false;
+    }
 
-    queryButtonElement.disabled = false;
+    else{
+        nextPageButtonElement.className = "d-none";
+    }
 }
 
 function addError(element, message){
@@ -96,6 +171,14 @@ function addError(element, message){
     element.appendChild(newError);
 }
 
+function addInfo(element, message){
+    let newInfo = document.createElement("div");
+    newInfo.className = "alert alert-info";
+    newInfo.setAttribute("role", "alert");
+    newInfo.textContent = message;
+    element.appendChild(newInfo);
+}
+
 function addSuccess(element, message){
     let newError = document.createElement("div");
     newError.className = "alert alert-success";
@@ -259,6 +342,17 @@ function parseEndRoundData(data){
     endRoundCorrectLocation.textContent = `Correct Location: ${data["correct_location"]}`;
 }
 
+function parseLiveScoreboard(standings){
+    liveScoreboardElement.innerHTML = "";
+
+    for (let [displayName, points, guessedCorrectly] of standings){
+        let newLi = document.createElement("li");
+        newLi.className = guessedCorrectly ? "text-success" : "";
+        newLi.textContent = `${displayName}: ${points}`;
+        liveScoreboardElement.appendChild(newLi);
+    }
+}
+
 function hideAllContainers(){
     lobbyContainer.className = "d-none";
     gameRoomContainer.className = "d-none";
@@ -287,6 +381,7 @@ function resetQueryElements(){
     queryOutputElement.innerHTML = "";
     resultElement.innerHTML = "";
     queryButtonElement.disabled = false;
+    updateTruncated(false);
 }
 
 function resetCodeMirror(){
@@ -311,12 +406,14 @@ const guessButtonElement = document.getElementById("guessButton");
 const queryOutputElement = document.getElementById("queryOutput");
 const queryButtonElement = document.getElementById("queryButton");
 const queryCountElement = document.getElementById("queryCount");
+const nextPageButtonElement = document.getElementById("nextPageButton");
 let queryCount = 0;
 
 const resultElement = document.getElementById("results");
 const timer = new Timer(document.getElementById("timer"));
 
 const hintsContainer = document.getElementById("hints");
+const liveScoreboardElement = document.getElementById("liveScoreboard");
 
 let roomStatus = 0;
 
@@ -329,78 +426,140 @@ const codeMirror = CodeMirror.fromTextArea(document.getElementById("codeEditor")
 codeMirror.setValue("SELECT foo_id FROM foo WHERE foo_name='bar';")
 codeMirror.setSize(null, 150);
 
+//the last version of the room's state this client has seen, sent when reconnecting
+let stateVersion = null;
 const socket = io();
 
-socket.on("start_game", () => {
-    startGame();
-});
-
+//the server answers with the changes missed since stateVersion, or the whole room state
 socket.on("connect", () => {
-    socket.emit("add_user");
+    socket.emit("resync", {version: stateVersion});
 });
 
 socket.on("guess", response => {
     parseGuessResponse(response);
 });
 
-socket.on("query", response => {
-    parseQueryResponse(response);
+socket.on("query", async response => {
+    parseQueryResponse(await decodeResult(response));
 });
 
-socket.on("hint", response => {
-    parseHintResponse(response);
+socket.on("next_page", async response => {
+    parseNextPageResponse(await decodeResult(response));
 });
 
-socket.on("end_round", data => {
-    timer.stop();
-    parseEndRoundData(JSON.parse(data));
+//events sent to the whole room arrive together in a batch
+const roomEvents = {
+    "start_game": () => {
+        startGame();
+    },
 
-    //clear old data
-    hintsContainer.innerHTML = "";
-    resetGuessElements();
-    resetQueryElements();
+    "hint": response => {
+        parseHintResponse(response);
+    },
 
-    hideAllContainers();
-    endRoundContainer.className = "";
-});
+    "end_round": data => {
+        timer.stop();
+        parseEndRoundData(data);
 
-socket.on("begin_round", () => {
-    timer.reset();
-    timer.start();
+        //clear old data
+        hintsContainer.innerHTML = "";
+        liveScoreboardElement.innerHTML = "";
+        resetGuessElements();
+        resetQueryElements();
 
-    queryCount = 0;
-    updateQueryCount();
+        hideAllContainers();
+        endRoundContainer.className = "";
+    },
 
-    hideAllContainers();
-    gameRoomContainer.className = "";
-    resetCodeMirror();
-});
+    "begin_round": () => {
+        timer.reset();
+        timer.start();
 
-socket.on("end_game", () => {
-    hideAllContainers();
-    endGameContainer.className = "";
+        queryCount = 0;
+        updateQueryCount();
 
-    timer.stop();
-    socket.disconnect();
-});
+        hideAllContainers();
+        gameRoomContainer.className = "";
+        resetCodeMirror();
+    },
 
-//user events
-socket.on("add_user", display_name => {
-    addUser(display_name);
-});
+    "end_game": () => {
+        hideAllContainers();
+        endGameContainer.className = "";
+
+        timer.stop();
+        socket.disconnect();
+    },
+
+    "scoreboard": standings => {
+        parseLiveScoreboard(standings);
+    },
+
+    //user events
+    "add_user": display_name => {
+        addUser(display_name);
+    },
+
+    "user_reconnect": index => {
+        reconnectUser(index);
+    },
+
+    "user_disconnect": index => {
+        disconnectUser(index);
+    },
 
-socket.on("user_reconnect", index => {
-    reconnectUser(index);
+    "remove_user": index => {
+        removeUser(index);
+    }
+};
+
+//a resync applies every missed change, including the client's own reconnect that was skipped for its new socket
+function applyRoomEvents(events, skipOwn = true){
+    for (let [event, payload, skipSid, version] of events){
+        //events without a version, like the live scoreboard, are not part of the room's state
+        if (version !== null){
+            //already part of the state this client has
+            if (stateVersion !== null && version <= stateVersion) continue;
+            stateVersion = version;
+        }
+
+        if (skipOwn && skipSid === socket.id) continue;
+
+        roomEvents[event](payload);
+    }
+}
+
+socket.on("batch", data => {
+    applyRoomEvents(JSON.parse(data));
 });
 
-socket.on("user_disconnect", index => {
-    disconnectUser(index);
-    console.log("disconnect", index);
+//reconnected and only sent the events that were missed
+socket.on("resync", data => {
+    let parsedData = JSON.parse(data);
+    applyRoomEvents(parsedData["changes"], false);
+    stateVersion = parsedData["version"];
+    roomStatus = parsedData["status"];
+
+    queryCount = parsedData["query_count"];
+    updateQueryCount();
+
+    //the timer kept counting down locally while disconnected, or stopped if the connection was lost for long
+    timer.stop();
+    if (roomStatus == 1){
+        timer.setTime(parsedData["current_time"]);
+        timer.start();
+    }
 });
 
 socket.on("join_room", data => {
     let parsedData = JSON.parse(data);
-    
+    stateVersion = parsedData["version"];
+    roomStatus = parsedData["status"];
+
+    //a reconnect that missed too many changes replaces everything shown
+    displayNameRow.innerHTML = "";
+    hintsContainer.innerHTML = "";
+
     for (user of parsedData["users"])
     {
         addUser(user["display_name"], user["status"]);
@@ -414,10 +573,23 @@ socket.on("join_room", data => {
     queryCount = parsedData["query_count"];
     updateQueryCount();
 
-    if (roomStatus == 2){
+    if (roomStatus == 1){
+        parseLiveScoreboard(parsedData["scoreboard"]);
+
+        timer.stop();
+        timer.setTime(parsedData["current_time"]);
+        timer.start();
+
+        hideAllContainers();
+        gameRoomContainer.className = "";
+        codeMirror.refresh();
+    }
+
+    else if (roomStatus == 2){
+        timer.stop();
         parseEndRoundData(parsedData);
 
         hideAllContainers();
         endRoundContainer.className = "";
     }
-});
\ No newline at end of file
+});
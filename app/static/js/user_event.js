@@ -25,7 +25,7 @@ function addUser(display_name, status){
 }
 
 function removeUser(index){
-    userDivs.splice(index, 1);
+    userDivs[index]?.remove();
 }
 
 function reconnectUser(index){
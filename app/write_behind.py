@@ -0,0 +1,120 @@
+import traceback
+from collections import deque
+from typing import Any, Callable, List, Union
+import eventlet
+from greenlet import getcurrent
+from app.metrics import Counter
+
+class WriteBehindQueue():
+    """Buffers records in memory and writes them in batches from a background task, so whoever records them never waits.
+
+    When the buffer is full, for example because writes are slow or failing, new records are dropped and counted instead of blocking.
+    """
+
+    def __init__(self, write_batch : Union[Callable[[List[Any]], None], None], records_counter : Counter,
+                 max_buffer : int = 10000, batch_size : int = 500, flush_interval : float = 1.0):
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._write_batch = write_batch
+        # counts records by 'written', 'dropped' or 'failed'
+        self._records_counter = records_counter
+        self._buffer = deque()
+        self._thread = None
+        self._stopping = False
+        # the green thread can only be killed while it sleeps, a batch it is writing would be lost
+        self._sleeping = False
+
+    @property
+    def enabled(self) -> bool:
+        return self._write_batch is not None
+
+    @property
+    def buffered(self) -> int:
+        return len(self._buffer)
+
+    def put(self, record : Any) -> bool:
+        """Buffer a record to be written, or drop it if the buffer is full.
+
+        Args:
+            record (Any): The record.
+
+        Returns:
+            bool: If the record was buffered.
+        """
+
+        if self._write_batch is None:
+            return False
+
+        if len(self._buffer) >= self.max_buffer:
+            self._records_counter.labels('dropped').inc()
+            return False
+
+        self._buffer.append(record)
+        return True
+
+    def flush(self) -> int:
+        """Write every buffered record in batches. Batches that fail are dropped and counted.
+
+        Returns:
+            int: The number of records written.
+        """
+
+        written = 0
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            try:
+                self._write_batch(batch)
+
+            except Exception: # pylint: disable=broad-except
+                # records made while writes fail are lost rather than kept until memory runs out
+                traceback.print_exc()
+                self._records_counter.labels('failed').inc(len(batch))
+                continue
+
+            self._records_counter.labels('written').inc(len(batch))
+            written += len(batch)
+
+        return written
+
+    def start(self) -> None:
+        """Start the green thread that writes buffered records. Unlike a background thread, it does not keep the process from exiting."""
+
+        if self._thread is not None or self._write_batch is None:
+            return
+
+        self._stopping = False
+        self._thread = eventlet.spawn(self._run)
+
+    def stop(self) -> int:
+        """Stop the green thread and write the records that are still buffered.
+
+        Returns:
+            int: The number of records written.
+        """
+
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return 0
+
+        self._stopping = True
+        if thread is not getcurrent():
+            if self._sleeping:
+                thread.kill()
+            else:
+                thread.wait()
+
+        return self.flush()
+
+    def _run(self) -> None:
+        """Write buffered records every flush interval until stopped."""
+
+        while not self._stopping:
+            self._sleeping = True
+            try:
+                eventlet.sleep(self.flush_interval)
+            finally:
+                self._sleeping = False
+
+            self.flush()
@@ -0,0 +1,370 @@
+"""Drive the app with simulated rooms of players and report how it held up as JSON.
+
+Every player goes through the real create/join routes and socket.io handlers in this process,
+against the database in DATABASE_URL and READONLY_DATABASE_URL (or --database-url).
+
+Run it with `python load_test.py --rooms 10 --players 5 --rounds 2 --round-length 20 > report.json`.
+With --max-errors, --max-query-p99 or --max-hint-delay-p99 it exits with status 1 when the run is over a limit.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import contextlib
+from typing import Any, Dict, List, Tuple, Union
+
+# modules imported above are patched in place
+import eventlet
+eventlet.monkey_patch()
+
+QUERIES = [
+    "SELECT location_name FROM game.location",
+    "SELECT location_name, location_biome FROM game.location WHERE location_biome = 'freshwater'",
+    "SELECT state_name FROM game.state ORDER BY state_name",
+    "SELECT l.location_name FROM game.location l JOIN game.state s ON s.state_id = l.state_id WHERE s.state_name LIKE 'L%'",
+    "SELECT a.animal_name, count(*) FROM game.location_animals la JOIN game.animal a ON a.animal_id = la.animal_id GROUP BY a.animal_name",
+    "SELECT l.location_name FROM game.location l JOIN game.location_animals la ON la.location_id = l.location_id JOIN game.animal a ON a.animal_id = la.animal_id WHERE a.animal_name = 'Otter'",
+]
+
+class LatencyRecorder():
+    """Durations in seconds, grouped by what was measured."""
+
+    def __init__(self):
+        self._samples : Dict[str, List[float]] = {}
+
+    def add(self, name : str, seconds : float) -> None:
+        self._samples.setdefault(name, []).append(seconds)
+
+    def count(self, name : str) -> int:
+        return len(self._samples.get(name, ()))
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Get the count and percentiles of every kind of sample, in milliseconds.
+
+        Returns:
+            Dict[str, Dict[str, float]]: The count, p50, p90, p99 and max of each kind of sample.
+        """
+
+        summary = {}
+        for name, samples in sorted(self._samples.items()):
+            samples = sorted(samples)
+            summary[name] = {'count' : len(samples)}
+            for label, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1)):
+                summary[name][label] = round(samples[min(len(samples) - 1, int(fraction * len(samples)))] * 1000, 3)
+
+        return summary
+
+class SimulatedPlayer():
+    def __init__(self, app, socketio, display_name : str, recorder : LatencyRecorder, poll_interval : float):
+        self._app = app
+        self._socketio = socketio
+        self.display_name = display_name
+        self._recorder = recorder
+        self._poll_interval = poll_interval
+
+        self.http = app.test_client()
+        self.socket = None
+        self.room_code = None
+
+        # when the round started and the seconds between its hints
+        self.round_start = None
+        self.hint_interval = None
+        self.hints_received = 0
+        self.round_over = eventlet.event.Event()
+        self.errors = 0
+        self.rate_limited = 0
+        self._watcher = None
+        # messages other than room events, such as replies to queries
+        self._replies = []
+
+    def create_room(self) -> bool:
+        """Host a new room through the create route.
+
+        Returns:
+            bool: If the room was created.
+        """
+
+        return self._post('create_room', '/room/create', {'display_name' : self.display_name})
+
+    def join_room(self, room_code : str) -> bool:
+        """Join a room through the join route.
+
+        Args:
+            room_code (str): The code of the room.
+
+        Returns:
+            bool: If the player joined the room.
+        """
+
+        return self._post('join_room', '/room/join', {'display_name' : self.display_name, 'room_code' : room_code})
+
+    def _post(self, name : str, path : str, data : Dict[str, str]) -> bool:
+        start = time.perf_counter()
+        response = self.http.post(path, data=data)
+        self._recorder.add(name, time.perf_counter() - start)
+
+        # the routes redirect to the game page on success and render the form again on failure
+        if response.status_code != 302:
+            self.errors += 1
+            return False
+
+        with self.http.session_transaction() as flask_session:
+            self.room_code = flask_session['room_code']
+
+        return True
+
+    def connect(self) -> None:
+        """Open the player's socket.io connection and start watching for room events."""
+
+        start = time.perf_counter()
+        self.socket = self._socketio.test_client(self._app, flask_test_client=self.http)
+        self._recorder.add('connect', time.perf_counter() - start)
+
+        self._watcher = eventlet.spawn(self._watch)
+
+    def disconnect(self) -> None:
+        if self._watcher:
+            self._watcher.kill()
+
+        if self.socket and self.socket.is_connected():
+            self.socket.disconnect()
+
+    def emit(self, event : str, *args : Any) -> Union[Any, None]:
+        """Send an event and time the handler, returning the reply it emitted back if there was one.
+
+        Args:
+            event (str): The name of the event.
+
+        Returns:
+            Union[Any, None]: The reply to the event.
+        """
+
+        start = time.perf_counter()
+        self.socket.emit(event, *args)
+        self._recorder.add(event, time.perf_counter() - start)
+
+        # the test client runs the handler inline, so its reply is already queued
+        self._drain()
+        replies = [received['args'][0] for received in self._replies if received['name'] == event]
+        self._replies = []
+        if not replies:
+            return None
+
+        if isinstance(replies[-1], dict) and replies[-1].get('rate_limited'):
+            self.rate_limited += 1
+
+        elif isinstance(replies[-1], dict) and replies[-1].get('error'):
+            self.errors += 1
+
+        return replies[-1]
+
+    def _watch(self) -> None:
+        while True:
+            self._drain()
+            eventlet.sleep(self._poll_interval)
+
+    def _drain(self) -> None:
+        """Handle the room events received since the last call and keep the other messages."""
+
+        now = time.perf_counter()
+        for received in self.socket.get_received():
+            if received['name'] != 'batch':
+                self._replies.append(received)
+                continue
+
+            for event, _payload, _skip_sid, _version in json.loads(received['args'][0]):
+                if event == 'hint':
+                    self._record_hint(now)
+
+                elif event == 'end_round' and not self.round_over.ready():
+                    self.round_over.send()
+
+    def _record_hint(self, received_at : float) -> None:
+        """Compare when a hint arrived to when it was scheduled for."""
+
+        if self.round_start is None:
+            return
+
+        self._recorder.add('hint_delay', max(0, received_at - (self.round_start + self.hints_received * self.hint_interval)))
+        self.hints_received += 1
+
+def play_round(room_manager, players : List[SimulatedPlayer], args : argparse.Namespace, round_event : str) -> None:
+    """Start a round from the host and have every player query and guess until it ends.
+
+    Args:
+        room_manager (RoomManager): The app's room manager, used to look up the answer for some guesses.
+        players (List[SimulatedPlayer]): The players, the first one is the host.
+        args (argparse.Namespace): The options of the load test.
+        round_event (str): 'start_game' for the first round, 'next_round' after it.
+    """
+
+    round_start = time.perf_counter()
+    for player in players:
+        player.round_over = eventlet.event.Event()
+        player.round_start = round_start
+        player.hint_interval = args.round_length / 4
+        player.hints_received = 0
+
+    players[0].emit(round_event)
+    answer = room_manager.get_room(players[0].room_code).answer
+
+    def play(player : SimulatedPlayer) -> None:
+        while not player.round_over.ready():
+            eventlet.sleep(random.uniform(args.think_min, args.think_max))
+            if player.round_over.ready():
+                break
+
+            if random.random() < args.guess_rate:
+                player.emit('guess', answer if random.random() < 0.5 else "nowhere")
+
+            else:
+                reply = player.emit('query', random.choice(QUERIES))
+                if isinstance(reply, dict) and reply.get('truncated'):
+                    player.emit('next_page')
+
+    pool = eventlet.GreenPool(len(players))
+    for player in players:
+        pool.spawn(play, player)
+
+    pool.waitall()
+
+def run_room(room_index : int, app, socketio, room_manager, args : argparse.Namespace, recorder : LatencyRecorder) -> Tuple[int, int]:
+    """Host a room, fill it with players and play every round.
+
+    Returns:
+        Tuple[int, int]: The number of errors the room's players saw and the number of their queries turned away by rate limits.
+    """
+
+    players = [SimulatedPlayer(app, socketio, f"player {room_index}-{i}", recorder, args.poll_interval) for i in range(args.players)]
+    host = players[0]
+    if not host.create_room():
+        return host.errors, 0
+
+    for player in players[1:]:
+        player.join_room(host.room_code)
+
+    players = [player for player in players if player.room_code]
+    for player in players:
+        player.connect()
+
+    for round_index in range(args.rounds):
+        play_round(room_manager, players, args, 'start_game' if round_index == 0 else 'next_round')
+
+    host.emit('end_game')
+
+    for player in players:
+        player.disconnect()
+
+    return sum(player.errors for player in players), sum(player.rate_limited for player in players)
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rooms', type=int, default=10, help="rooms played at the same time")
+    parser.add_argument('--players', type=int, default=5, help="players in each room, including the host")
+    parser.add_argument('--rounds', type=int, default=1, help="rounds played in each room")
+    parser.add_argument('--round-length', type=int, default=20, help="seconds in each round")
+    parser.add_argument('--think-min', type=float, default=1, help="shortest pause in seconds between a player's actions")
+    parser.add_argument('--think-max', type=float, default=3, help="longest pause in seconds between a player's actions")
+    parser.add_argument('--guess-rate', type=float, default=0.1, help="chance that an action is a guess instead of a query")
+    parser.add_argument('--poll-interval', type=float, default=0.005, help="seconds between checks for room events, the resolution of hint delays")
+    parser.add_argument('--database-url', help="run against this database instead of DATABASE_URL and READONLY_DATABASE_URL")
+    parser.add_argument('--seed', type=int, help="seed for the players' random choices")
+    parser.add_argument('--max-errors', type=int, help="fail if players saw more errors than this")
+    parser.add_argument('--max-query-p99', type=float, help="fail if the 99th percentile query latency is over this many milliseconds")
+    parser.add_argument('--max-hint-delay-p99', type=float, help="fail if the 99th percentile hint delay is over this many milliseconds")
+    return parser.parse_args()
+
+def app_stats() -> Dict[str, Any]:
+    from app import game_database # pylint: disable=import-outside-toplevel
+
+    return {
+        'query_cache' : game_database.query_cache.stats(),
+        'readonly_pool' : game_database.get_pool_stats(),
+        }
+
+def check_thresholds(report : Dict[str, Any], args : argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    """Compare a report to the limits that were given.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The limit, measured value and result of every limit that was given.
+    """
+
+    latency = report['latency_ms']
+    measured = {
+        'errors' : (args.max_errors, report['errors']),
+        'query_p99_ms' : (args.max_query_p99, latency.get('query', {}).get('p99')),
+        'hint_delay_p99_ms' : (args.max_hint_delay_p99, latency.get('hint_delay', {}).get('p99')),
+        }
+
+    thresholds = {}
+    for name, (limit, value) in measured.items():
+        if limit is None:
+            continue
+
+        # nothing measured, such as no hints in a short round, passes
+        thresholds[name] = {'limit' : limit, 'value' : value, 'passed' : value is None or value <= limit}
+
+    return thresholds
+
+def run(args : argparse.Namespace) -> Dict[str, Any]:
+    """Play every room and build the report.
+
+    Returns:
+        Dict[str, Any]: The report.
+    """
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+        os.environ['READONLY_DATABASE_URL'] = args.database_url
+
+    # rooms read the round length when they are created
+    os.environ['ROUND_LENGTH'] = str(args.round_length)
+    os.environ.setdefault('SECRET_KEY', 'load-test')
+
+    from app import app, socketio, room_manager, shutdown # pylint: disable=import-outside-toplevel
+
+    recorder = LatencyRecorder()
+    start = time.perf_counter()
+
+    pool = eventlet.GreenPool(args.rooms)
+    room_results = list(pool.imap(lambda room_index: run_room(room_index, app, socketio, room_manager, args, recorder), range(args.rooms)))
+
+    elapsed = time.perf_counter() - start
+    report = {
+        'config' : {name : value for name, value in vars(args).items() if name != 'database_url'},
+        'elapsed' : round(elapsed, 3),
+        'errors' : sum(errors for errors, _ in room_results),
+        'rate_limited' : sum(rate_limited for _, rate_limited in room_results),
+        'throughput' : {
+            'queries_per_second' : round(recorder.count('query') / elapsed, 3),
+            'events_per_second' : round(sum(recorder.count(event) for event in ('query', 'next_page', 'guess')) / elapsed, 3),
+            },
+        'latency_ms' : recorder.summary(),
+        'app' : app_stats(),
+        }
+    report['thresholds'] = check_thresholds(report, args)
+
+    # stop the scheduler and write what the audit log and round history still buffer before the report is final
+    shutdown()
+    return report
+
+def main() -> int:
+    args = parse_args()
+
+    # the app logs with print, which would mix with the report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(args)
+
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+    return 0 if all(threshold['passed'] for threshold in report['thresholds'].values()) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
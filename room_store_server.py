@@ -0,0 +1,150 @@
+"""A local stand-in for Redis that lets several workers on one machine share room state.
+
+Run it with `python room_store_server.py [host:port] [authkey]` and start each worker with
+ROOM_STORE_URL=memory://:authkey@host:port.
+"""
+
+import os
+import sys
+import time
+import types
+import threading
+from multiprocessing.managers import BaseManager
+from typing import List, Set, Union
+
+# importing the app package starts a worker, so app/room_store.py is imported without running app/__init__.py
+if 'app' not in sys.modules:
+    sys.modules['app'] = types.ModuleType('app')
+    sys.modules['app'].__path__ = [os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app')]
+
+# the only script SharedRoomStore runs
+from app.room_store import RELEASE_LOCK_SCRIPT # pylint: disable=wrong-import-position
+
+class MemoryKeyValue():
+    """The subset of redis.Redis that SharedRoomStore uses, kept in memory."""
+
+    def __init__(self):
+        self._values = {}
+        self._expiry = {}
+        # sets are kept apart from values and never expire
+        self._sets = {}
+        # the manager serves each connection from its own thread
+        self._lock = threading.Lock()
+
+    def get(self, name : str) -> Union[bytes, None]:
+        with self._lock:
+            self._expire(name)
+            return self._values.get(name)
+
+    def set(self, name : str, value : Union[bytes, str], nx : bool = False, xx : bool = False, px : Union[int, None] = None) -> bool:
+        with self._lock:
+            self._expire(name)
+            if (nx and name in self._values) or (xx and name not in self._values):
+                return False
+
+            self._values[name] = value.encode() if isinstance(value, str) else value
+            self._expiry.pop(name, None)
+            if px is not None:
+                self._expiry[name] = time.monotonic() + px / 1000
+
+            return True
+
+    def delete(self, name : str) -> int:
+        with self._lock:
+            self._expire(name)
+            self._expiry.pop(name, None)
+            return int(self._values.pop(name, None) is not None)
+
+    def incr(self, name : str) -> int:
+        return self._add(name, 1)
+
+    def decr(self, name : str) -> int:
+        return self._add(name, -1)
+
+    def mget(self, names : List[str]) -> List[Union[bytes, None]]:
+        with self._lock:
+            for name in names:
+                self._expire(name)
+
+            return [self._values.get(name) for name in names]
+
+    def sadd(self, name : str, *values : str) -> int:
+        with self._lock:
+            members = self._sets.setdefault(name, set())
+            added = len(set(values) - members)
+            members.update(values)
+            return added
+
+    def srem(self, name : str, *values : str) -> int:
+        with self._lock:
+            members = self._sets.get(name, set())
+            removed = len(members & set(values))
+            members.difference_update(values)
+            return removed
+
+    def smembers(self, name : str) -> Set[str]:
+        with self._lock:
+            return set(self._sets.get(name, ()))
+
+    def eval(self, script : str, numkeys : int, *keys_and_args) -> int:
+        """Run the script that releases a room lock, which deletes a key only if it still has a value. No other script is supported.
+
+        Args:
+            script (str): RELEASE_LOCK_SCRIPT.
+            numkeys (int): 1, the lock's key comes first.
+
+        Returns:
+            int: 1 if the key was deleted.
+        """
+
+        if script != RELEASE_LOCK_SCRIPT or numkeys != 1:
+            raise NotImplementedError("Only the lock release script is supported")
+
+        name, value = keys_and_args
+        value = value.encode() if isinstance(value, str) else value
+        with self._lock:
+            self._expire(name)
+            if self._values.get(name) != value:
+                return 0
+
+            self._expiry.pop(name, None)
+            del self._values[name]
+            return 1
+
+    def _add(self, name : str, amount : int) -> int:
+        with self._lock:
+            self._expire(name)
+            value = int(self._values.get(name) or 0) + amount
+            self._values[name] = str(value).encode()
+            return value
+
+    def _expire(self, name : str) -> None:
+        expiry = self._expiry.get(name)
+        if expiry is not None and expiry <= time.monotonic():
+            del self._expiry[name]
+            self._values.pop(name, None)
+
+def serve(host : str = '127.0.0.1', port : int = 5001, authkey : str = 'sqlguess') -> None:
+    """Serve one MemoryKeyValue to every worker that connects.
+
+    Args:
+        host (str, optional): The address to listen on. Defaults to '127.0.0.1'.
+        port (int, optional): The port to listen on. Defaults to 5001.
+        authkey (str, optional): The key workers authenticate with. Defaults to 'sqlguess'.
+    """
+
+    store = MemoryKeyValue()
+
+    class StoreManager(BaseManager):
+        pass
+
+    StoreManager.register('store', callable=lambda: store)
+
+    manager = StoreManager(address=(host, port), authkey=authkey.encode())
+    print(f"Serving room store on {host}:{port}")
+    manager.get_server().serve_forever()
+
+if __name__ == '__main__':
+    address = sys.argv[1] if len(sys.argv) > 1 else '127.0.0.1:5001'
+    serve_host, serve_port = address.rsplit(':', 1)
+    serve(serve_host, int(serve_port), *sys.argv[2:3])
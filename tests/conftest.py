@@ -0,0 +1,32 @@
+"""The tests run the app in this process, against the database in DATABASE_URL and READONLY_DATABASE_URL like the app itself.
+
+Tests that need the app are skipped when those are not set.
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import os
+import sys
+import pytest
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DATABASE_CONFIGURED = bool(os.environ.get('DATABASE_URL') and os.environ.get('READONLY_DATABASE_URL'))
+os.environ.setdefault('SECRET_KEY', 'tests')
+
+@pytest.fixture(scope='session')
+def sqlguess():
+    """The app package, imported once the database is configured."""
+
+    if not DATABASE_CONFIGURED:
+        pytest.skip("DATABASE_URL and READONLY_DATABASE_URL are not set")
+
+    import app # pylint: disable=import-outside-toplevel
+
+    app.game_database.ensure_ready()
+    return app
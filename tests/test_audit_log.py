@@ -0,0 +1,20 @@
+import json
+from app.audit_log import AuditLog, AuditRecord, FileAuditSink
+
+def test_records_are_written_with_the_time_they_were_logged(tmp_path):
+    path = tmp_path / 'audit.jsonl'
+    audit_log = AuditLog(FileAuditSink(str(path)), clock=lambda: 0.0)
+
+    audit_log.record(AuditRecord('abcd', 'user', 'select ?', 0.25, row_count=3))
+    assert audit_log.flush() == 1
+
+    [line] = path.read_text(encoding='utf-8').splitlines()
+    assert json.loads(line) == {
+        'room_code' : 'abcd',
+        'user_id' : 'user',
+        'query' : 'select ?',
+        'duration' : 0.25,
+        'row_count' : 3,
+        'error' : None,
+        'logged_at' : '1970-01-01T00:00:00+00:00'
+        }
@@ -0,0 +1,33 @@
+import os
+import psycopg2
+from app.db_pool import GreenConnectionPool
+
+def connect():
+    conn = psycopg2.connect(os.environ['READONLY_DATABASE_URL'])
+    conn.autocommit = True
+    return conn
+
+def test_returned_transaction_is_rolled_back(sqlguess):
+    pool = GreenConnectionPool(connect, max_size=1)
+
+    with pool.borrow() as conn:
+        conn.cursor().execute('BEGIN')
+
+    with pool.borrow() as reused:
+        assert reused is conn
+        assert reused.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+def test_unhealthy_idle_connections_are_not_checked_out(sqlguess):
+    pool = GreenConnectionPool(connect, max_size=2)
+    closed, in_transaction = pool.getconn(), pool.getconn()
+    pool.putconn(closed)
+    pool.putconn(in_transaction)
+
+    closed.close()
+    # left in a transaction without going through putconn
+    in_transaction.cursor().execute('BEGIN')
+
+    conn = pool.getconn()
+    assert conn not in (closed, in_transaction)
+    assert pool.stats()['recycled'] == 2
+    pool.putconn(conn)
@@ -0,0 +1,37 @@
+import uuid
+
+def test_several_statements_return_the_last_result(sqlguess):
+    returning = sqlguess.game_database.execute_user_input("SELECT location_name FROM game.location WHERE location_id < 4; SELECT 'x', 'y', 'z'")
+
+    assert returning['result'] == [['x', 'y', 'z']]
+    assert len(returning['columns']) == 3
+
+def test_single_statement_is_paged(sqlguess, monkeypatch):
+    game_database = sqlguess.game_database
+    monkeypatch.setattr(game_database, '_max_rows', 2)
+    owner = uuid.uuid4()
+
+    first = game_database.execute_user_input("-- every location\nSELECT location_id FROM game.location ORDER BY location_id;", owner)
+    assert first['truncated']
+    assert len(first['result']) == 2
+
+    second = game_database.fetch_next_page(owner)
+    assert second['offset'] == 2
+    assert second['result'][0][0] > first['result'][-1][0]
+
+    game_database.release_cursor(owner)
+
+def test_session_changes_are_rejected(sqlguess):
+    game_database = sqlguess.game_database
+
+    for query in ("SET statement_timeout = 0", "COMMIT; SELECT pg_sleep(10)", "SELECT set_config('work_mem', '1GB', false)"):
+        assert 'not allowed' in game_database.execute_user_input(query)['error']
+
+    assert game_database.execute_user_input("SHOW statement_timeout")['result'] != [['0']]
+
+def test_session_is_reset_after_a_query_that_changes_it(sqlguess):
+    game_database = sqlguess.game_database
+
+    game_database.execute_user_input("PREPARE left_behind AS SELECT 1")
+    returning = game_database.execute_user_input("SELECT count(*) FROM pg_prepared_statements")
+    assert returning['result'] == [[0]]
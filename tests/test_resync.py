@@ -0,0 +1,45 @@
+import json
+
+def join(sqlguess, path, data):
+    """Create or join a room over HTTP, returning the flask client that holds the session."""
+
+    client = sqlguess.app.test_client()
+    response = client.post(path, data=data)
+    assert response.status_code == 302
+    return client
+
+def received(socket_client, event):
+    return [json.loads(message['args'][0]) for message in socket_client.get_received() if message['name'] == event]
+
+def test_reconnecting_client_receives_the_changes_it_missed(sqlguess):
+    host = join(sqlguess, '/room/create', {'display_name' : 'host'})
+    with host.session_transaction() as session:
+        room_code = session['room_code']
+
+    player = join(sqlguess, '/room/join', {'display_name' : 'player', 'room_code' : room_code})
+
+    host_socket = sqlguess.socketio.test_client(sqlguess.app, flask_test_client=host)
+    host_socket.emit('resync', {'version' : None})
+
+    player_socket = sqlguess.socketio.test_client(sqlguess.app, flask_test_client=player)
+    player_socket.emit('resync', {'version' : None})
+    [joined] = received(player_socket, 'join_room')
+    player_socket.disconnect()
+
+    # a player joins while the first one is away
+    late_player = join(sqlguess, '/room/join', {'display_name' : 'late player', 'room_code' : room_code})
+    late_socket = sqlguess.socketio.test_client(sqlguess.app, flask_test_client=late_player)
+
+    player_socket = sqlguess.socketio.test_client(sqlguess.app, flask_test_client=player)
+    player_socket.emit('resync', {'version' : joined['version']})
+    [resync] = received(player_socket, 'resync')
+
+    events = [change[0] for change in resync['changes']]
+    assert events[0] == 'user_disconnect'
+    assert 'add_user' in events
+    assert 'user_reconnect' in events
+    assert resync['version'] > joined['version']
+    assert not received(player_socket, 'join_room')
+
+    for socket_client in (player_socket, late_socket, host_socket):
+        socket_client.disconnect()
@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+import socket
+import subprocess
+import eventlet
+import pytest
+from conftest import ROOT
+
+@pytest.fixture
+def room_store_url():
+    """Start room_store_server.py on a free port, like a deployment with several workers."""
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'room_store_server.py'), f'127.0.0.1:{port}', 'tests'], stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+
+                eventlet.sleep(0.05)
+
+        yield f'memory://:tests@127.0.0.1:{port}'
+
+    finally:
+        server.terminate()
+        server.wait()
+
+def test_two_workers_share_rooms(sqlguess, room_store_url):
+    from app.room_management import Room, RoomManager # pylint: disable=import-outside-toplevel
+    from app.room_store import create_room_store # pylint: disable=import-outside-toplevel
+
+    # each worker has its own connection to the store
+    first, second = (RoomManager(create_room_store(room_store_url, Room.from_state)) for _ in range(2))
+
+    room = first.host_room()
+    room.set_host('host')
+    first.save_room(room)
+
+    # players joining through both workers at once are all kept
+    joins = [eventlet.spawn(worker.add_user_to_room, room.room_code, f'player {i}') for i, worker in enumerate([first, second] * 5)]
+    assert all(join.wait() for join in joins)
+
+    assert len(first.get_room(room.room_code).users) == 11
+    assert [stored.room_code for stored in second._store.rooms()] == [room.room_code] # pylint: disable=protected-access
+
+    assert first.get_room_code_stats()['in_use'] == 1
+    assert second.get_room_code_stats()['in_use'] == 1
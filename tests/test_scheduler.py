@@ -0,0 +1,45 @@
+import os
+import sys
+import subprocess
+import eventlet
+from conftest import ROOT
+
+def test_stop_ends_the_loop(sqlguess):
+    from app.scheduler import Scheduler # pylint: disable=import-outside-toplevel
+
+    scheduler = Scheduler(resolution=0.01)
+    fired = []
+    scheduler.start()
+    scheduler.call_later(0, fired.append, 'before')
+    eventlet.sleep(0.05)
+
+    scheduler.stop()
+    scheduler.call_later(0, fired.append, 'after')
+    eventlet.sleep(0.05)
+    assert fired == ['before']
+
+    # calls scheduled while stopped fire once it is started again
+    scheduler.start()
+    eventlet.sleep(0.05)
+    scheduler.stop()
+    assert fired == ['before', 'after']
+
+def test_write_behind_stop_writes_buffered_records(sqlguess):
+    from app.metrics import Counter # pylint: disable=import-outside-toplevel
+    from app.write_behind import WriteBehindQueue # pylint: disable=import-outside-toplevel
+
+    written = []
+    queue = WriteBehindQueue(written.extend, Counter('test_records', "Test records.", ['result']), flush_interval=60)
+    queue.start()
+    queue.put(1)
+    queue.put(2)
+    eventlet.sleep(0)
+
+    assert queue.stop() == 2
+    assert written == [1, 2]
+
+def test_process_exits_after_importing_app(sqlguess):
+    # the scheduler's and write-behind queues' green threads must not keep a process alive
+    code = "import eventlet; eventlet.monkey_patch(); import app"
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=dict(os.environ), timeout=60, capture_output=True, check=False)
+    assert result.returncode == 0, result.stderr.decode()
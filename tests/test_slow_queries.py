@@ -0,0 +1,37 @@
+import time
+import eventlet
+from app.scheduler import scheduler
+
+def test_hint_is_sent_on_time_during_a_slow_query(sqlguess):
+    room = sqlguess.room_manager.host_room()
+    room.available_hints = [('State', 'Somewhere')]
+    sent = []
+
+    def send_hint(scheduled_for):
+        sent.append(scheduler.clock() - scheduled_for)
+        room._send_hint(scheduled_for) # pylint: disable=protected-access
+
+    due = scheduler.clock() + 0.1
+    scheduler.call_at(due, send_hint, due)
+
+    # the query waits on postgres without blocking the scheduler
+    returning = sqlguess.game_database.execute_user_input("SELECT pg_sleep(0.4)")
+
+    assert 'error' not in returning
+    assert len(sent) == 1
+    assert sent[0] < 0.1
+    assert room.given_hints == [('State', 'Somewhere')]
+
+def test_db_time_leaves_out_the_wait_for_a_slot(sqlguess, monkeypatch):
+    game_database = sqlguess.game_database
+    monkeypatch.setattr(game_database._query_executor, 'workers', 1) # pylint: disable=protected-access
+
+    slow = eventlet.spawn(game_database.execute_user_input, "SELECT pg_sleep(0.3), 'slow'", None, 'room')
+    eventlet.sleep(0.05)
+
+    start = time.perf_counter()
+    returning = game_database.execute_user_input("SELECT 'queued behind the slow query'", None, 'room')
+
+    assert time.perf_counter() - start > 0.2
+    assert returning['db_time'] < 0.1
+    assert slow.wait()['db_time'] > 0.3
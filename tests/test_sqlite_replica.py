@@ -0,0 +1,31 @@
+import uuid
+import eventlet
+from app.sqlite_replica import SQLiteReplica
+
+# every row after the first two takes many progress handler steps to reach
+SLOW_ROWS = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < 200000) SELECT x FROM n WHERE x < 3 OR x % 50000 = 0"
+
+def test_cursor_released_during_a_page_read_is_closed_after_it(sqlguess, monkeypatch):
+    game_database = sqlguess.game_database
+    replica = SQLiteReplica(timeout=5, progress_steps=100)
+    replica.load(game_database.Session)
+    monkeypatch.setattr(game_database, '_replica', replica)
+    monkeypatch.setattr(game_database, '_max_rows', 2)
+    owner = uuid.uuid4()
+
+    first = game_database.execute_user_input(SLOW_ROWS, owner)
+    assert first['truncated']
+    held = game_database._held_cursors[owner] # pylint: disable=protected-access
+
+    # the read yields to other greenlets from the progress handler
+    reading = eventlet.spawn(game_database.fetch_next_page, owner)
+    eventlet.sleep(0)
+    assert held.reading
+
+    # the round ends while the page is being read
+    game_database.release_cursor(owner)
+    second = reading.wait()
+
+    assert second['result'] == [[50000], [100000]]
+    assert owner not in game_database._held_cursors # pylint: disable=protected-access
+    assert list(replica._idle) == [held.conn] # pylint: disable=protected-access